@@ -18,12 +18,13 @@ import json # To read config json
 import geopandas as gpd # For GeoJSON
 import psycopg2 # For PostgreSQL Database Queries
 import sys # For Runtime Environment
-import os # OS kernel module access
 import datetime
-import calendar
 import time
-import math
-import numpy as np
+import geoentity_bulk_loader # COPY based Phase-2 insertion
+import spatial_join # Parallel Phase-3 parent assignment
+import db_pool # Pooled connections for the Phase-3 join
+import parent_lookup # STRtree parent assignment during Phase-2
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # Parallel geoentity keys
 
 
 class GeoEntityIngest:
@@ -61,60 +62,355 @@ class GeoEntityIngest:
             print("Unsupported option "+opt+" for prinitng.")
      
             
-    def __get_aux_data(self,attributes_array,row):
-        returnobj={'features':{}}
-        for att in attributes_array:
-            if 'Level_IV' in att:
-              returnobj['features']['Level_lV']=str(row[att])
-            else:
-              returnobj['features'][att]=str(row[att])            
-            
-        return json.dumps(returnobj)
-     
-        
-            
-            
-            
-    def __getGeoEntityID(GeoEntityIDKeys,row,type):
+    #------------------------------------#
+    # Main Methods for execution         #
+    #------------------------------------#
+    def ingest_geoentity(self,cur,geoentity,geoentity_config,database_config,previous_parent_id=None,frames=None,batch_size=geoentity_bulk_loader.DEFAULT_BATCH_SIZE,progress=None,spatial_join_workers=spatial_join.DEFAULT_WORKERS,resume=None,checkpoint=None):
         """
         Purpose
         ----------
-        This method will give ID of GeoEntity
+        This method will run Phase-1 (source), Phase-2 (geoentities) and Phase-3 (spatial join) for one geoentity key.
 
         Parameters
         ----------
-        ZoneIDKeys : Ordered Arrays for Key Parsing
-        row : GeoJSON row for dataset extraction
+        cur : cursor of an autocommit connection
+        geoentity : key of the geoentity in config
+        geoentity_config : config["config"][geoentity] block
+        database_config : config["global_param"]["database"] block
+        previous_parent_id : source id inherited by parent_geoentity_source_id -1
+        frames : GeoDataFrame or iterable of GeoDataFrame chunks, read from file_path when None
+        batch_size : features per COPY batch
+        progress : optional callable(phase, counters) for progress reporting
+        spatial_join_workers : parallel Phase-3 join batches
+        resume : checkpoint {"geoentity_source_id", "feature_offset", "counters"} of an interrupted load, Phase-1 is skipped
+                 and Phase-2 continues at feature_offset (frames, when given, must already start there)
+        checkpoint : optional callable(geoentity_source_id, feature_offset, counters) after every committed batch
 
         Returns
         -------
-        zoneid : String contain ZoneID
+        (previous_parent_id for the next key, Phase-2 counters or None)
         """
-        if type=="Int":
-            return str(int(row[GeoEntityIDKeys]))       
+        geoentity_table=database_config["geoentity_table"]
+        geoentity_source_table=database_config["geoentity_source_table"]
+        geoentity_source_seq=database_config["geoentity_source_seq"]
+
+        #SourceInfo Loading
+        source_name=geoentity_config["geoentity_source"]["name"]
+        source_publish_date_yyyymmdd=time.mktime(datetime.datetime.strptime(geoentity_config["geoentity_source"]["publish_date_yyyymmdd"], "%Y%m%d").timetuple())
+        source_project=geoentity_config["geoentity_source"]["project"]
+        source_provider=geoentity_config["geoentity_source"]["provider"]
+        source_category=geoentity_config["geoentity_source"]["category"]
+        source_aux=geoentity_config["geoentity_source"]["aux_data"]
+
+        #ConfigInfo Loading
+        config_geojsonfile_file_path=geoentity_config["geoentity_config"]["geoJSON_file_config"]["file_path"]
+        config_geojsonfile_parent_geoent_source_id=geoentity_config["geoentity_config"]["geoJSON_file_config"]["parent_geoentity_source_id"]
+
+        if (previous_parent_id is not None) and (config_geojsonfile_parent_geoent_source_id==-1):
+            config_geojsonfile_parent_geoent_source_id=previous_parent_id
+            self.__printMsg("Info"," Previous parent id:"+str(previous_parent_id)+" is set for geoentity: "+geoentity)
+        elif (config_geojsonfile_parent_geoent_source_id==-1):
+            self.__printMsg("Error","First element and incase of parent insertion failure parent_id can't be inherited. please check parent_geoentity_source_id configuration for geoentity: "+geoentity)
+            sys.exit()
+
+        #None Checking for Parameters
+        if not self.config_complete(geoentity_config):
+            self.__printMsg('Error', "=====Configuration error, please see config once for "+geoentity+" ======")
+            return previous_parent_id, None
+        self.__printMsg('Info', geoentity+" Parameters(Global and Config) loaded successfully.")
+
+
+        #Phase 1: Insertion Algo - Source Insertion
+        self.__printMsg("Info", "Phase-1: GeoEntity Source Insertion Started.")
+        if progress:
+            progress("Phase-1", None)
+        geoentity_source_id=None
+        source_insertion_query=None
+        if not(source_aux=="NULL" or source_aux=="null" or source_aux=="Null" or source_aux==""):
+            source_aux="'"+source_aux+"'"
         else:
-            return str(row[GeoEntityIDKeys])
+            source_aux="NULL"
 
-        
-    def __getGeom(wkt):
+      #-----Resumed load: the source of the interrupted run is reused
+        if resume is not None:
+            geoentity_source_id=resume["geoentity_source_id"]
+            self.__printMsg('Info', " (Phase1) Resuming "+geoentity+" on source "+str(geoentity_source_id)+" at feature "+str(resume["feature_offset"]))
+        else:
+            #Concurrent ingestions (threads or worker processes) must not interleave setval and insert on the sequence
+            cur.execute("SELECT pg_advisory_lock(hashtext(%s))",(geoentity_source_table,))
+            #-----If duplicate exist then return id for phase-2 execution
+            try:
+                cur.execute("SELECT setval('"+geoentity_source_seq+"', max(id)) from "+geoentity_source_table)
+                if(config_geojsonfile_parent_geoent_source_id>0):
+                    source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata,parent_source_id) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+","+str(config_geojsonfile_parent_geoent_source_id)+") returning id;"
+                else:
+                    source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+") returning id;"
+                self.__printMsg('Info', source_insertion_query)
+                cur.execute(source_insertion_query)
+                if(cur.rowcount<1): #0 row
+                    self.__printMsg('Error', "=====(Phase1) Source insertion failed for "+geoentity+" ======")
+                    return previous_parent_id, None
+                else:
+                    geoentity_source_id=cur.fetchone()[0]
+                    self.__printMsg('Info', " (Phase1) Source Insertion Completed Successfully.")
+            except psycopg2.Error as e:
+
+                if "duplicate" in e.pgerror:
+                    self.__printMsg('Error', "=====(Phase1) Already Source is existing for "+geoentity+" ======")
+                    if geoentity_config["geoentity_source"]["reprocess_flag"]:
+                        geoentity_source_id=self.existing_source_id(cur,geoentity_config,geoentity_source_table)
+                    else:
+                        sys.exit()
+                else:
+                    self.__printMsg('Error', " Phase1 Source Insertion for <"+geoentity+"> has been failed.")
+                    return None, None
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext(%s))",(geoentity_source_table,))
+        self.__printMsg("Info", "Phase1: GeoEntity Source Processing Completed Successfully.")
+
+
+        #Phase 2: Insertion Algo - GeoEntity Insertion
+        self.__printMsg("Info", "Phase-2: GeoEntity Insertion Started.")
+        total_records=0
+        processed_record=0
+        failed_record=0
+        if frames is None:
+            try:
+                frames = gpd.read_file(config_geojsonfile_file_path)
+                frames.set_crs(epsg=4326, inplace=True, allow_override=True)
+                if resume is not None:
+                    frames = frames.iloc[resume["feature_offset"]:]
+                self.__printMsg("Info"," Reading of "+geoentity+" geojson file has been completed.")
+                total_records=frames.shape[0]
+                self.__printMsg("Info"," In "+geoentity+" total records for processing:"+str(total_records))
+            except:
+                self.__printMsg("Error", "Phase2 Sorry reading error for "+geoentity+" geojson file, please check the file once.")
+                return None, None
+        else:
+            self.__printMsg("Info"," "+geoentity+" geojson file is streamed in chunks of "+str(batch_size)+" features.")
+
+        def report_phase2(counters):
+            if progress:
+                progress("Phase-2", counters)
+
+        #A resumed load may repeat the batch committed just before the interruption, its rows are already present
+        reprocess_flag=geoentity_config["geoentity_source"]["reprocess_flag"] or (resume is not None)
+
+        #Reprocessed child layer: existing rows carry the parent prefix, they get their file ids back and are joined again in Phase-3
+        #(rejoin_parents is false when the rows of the reprocessed features were deleted beforehand, see ingestion_worker)
+        parent_join_reset=False
+        if (config_geojsonfile_parent_geoent_source_id>0) and reprocess_flag and geoentity_config["geoentity_source"].get("rejoin_parents",True):
+            reset_rows=spatial_join.reset_parent_join(cur,geoentity_table,geoentity_source_id)
+            parent_join_reset=True
+            self.__printMsg("Info"," Phase2 Parent assignment reset on "+str(reset_rows)+" existing rows of "+geoentity)
+
+        #Optional in-process parent assignment, the parent source is already in the geoentity table.
+        #Not after a reset: prefixed ids would never meet the reset rows in the ON CONFLICT of the reprocess modes
+        parent_index=None
+        if (config_geojsonfile_parent_geoent_source_id>0) and geoentity_config["geoentity_config"]["geoJSON_file_config"].get("inmemory_parent_lookup",False):
+            if parent_join_reset:
+                self.__printMsg("Info"," Phase2 inmemory_parent_lookup is not used while reprocessing "+geoentity+", parents are assigned by Phase-3")
+            else:
+                parent_index=parent_lookup.ParentIndex.from_database(cur,geoentity_table,config_geojsonfile_parent_geoent_source_id)
+
+        def report_checkpoint(feature_offset, counters):
+            if checkpoint:
+                checkpoint(geoentity_source_id, feature_offset, counters)
+
+        try:
+            counters=geoentity_bulk_loader.bulk_insert(cur,frames,geoentity_source_id,config_geojsonfile_parent_geoent_source_id,geoentity_config["geoentity_config"]["geoJSON_file_config"],reprocess_flag,geoentity_table,batch_size,progress=report_phase2,parent_index=parent_index,
+                                                       start_offset=resume["feature_offset"] if resume else 0,checkpoint=report_checkpoint,counters=resume["counters"] if resume else None,
+                                                       reprocess_mode=geoentity_config["geoentity_source"].get("reprocess_mode","skip"),compare_hash=geoentity_config["geoentity_source"].get("reprocess_compare_hash",True))
+        except psycopg2.errors.UniqueViolation:
+            self.__printMsg("Error", "Phase2 Duplicate geoentity found for "+geoentity+" and reprocess_flag is false.")
+            sys.exit()
+        processed_record=counters["processed"]
+        failed_record=counters["failed"]
+
+        self.__printMsg("Info"," Phase2 GeoEntity Insertion: Successfully processed records:"+str(processed_record))
+        self.__printMsg("Info"," Phase2 GeoEntity Insertion: Inserted:"+str(counters["inserted"])+", Updated:"+str(counters["updated"])+", Unchanged:"+str(counters["unchanged"]))
+        self.__printMsg("Info"," Phase2 GeoEntity Insertion: Failed Records:"+str(failed_record)+" \n")
+        if parent_index is not None:
+            self.__printMsg("Info"," Phase2 GeoEntity Insertion: Records inserted with parent:"+str(counters["parent_matched"]))
+        self.__printMsg("Info", "Phase2: GeoEntity Insertion Successfully Completed.")
+
+
+        #Phase3: Spaitail Join
+        #Phase3: Parent Condition Checking
+        if (config_geojsonfile_parent_geoent_source_id!=0):
+            self.__printMsg("Info"," Phase3: Spatial join statred.")
+            if progress:
+                progress("Phase-3", counters)
+            if(geoentity_config["geoentity_config"]["geoJSON_file_config"]["spatailjoin_flag"]):
+                #Set based join over pooled connections, children already having a parent (resumed run or inmemory_parent_lookup) are skipped
+                def report_phase3(summary):
+                    if progress:
+                        progress("Phase-3", dict(counters, join_batches=summary["batches"], join_batches_done=summary["done"], join_updated=summary["updated"]))
+
+                join_pool=db_pool.PooledDB(database_config["db"], database_config["username"], database_config["password"], database_config["host"], database_config["port"], maxconn=spatial_join_workers+1, statement_timeout_ms=0)
+                try:
+                    join_summary=spatial_join.parallel_parent_join(join_pool,geoentity_table,geoentity_source_id,config_geojsonfile_parent_geoent_source_id,workers=spatial_join_workers,progress=report_phase3)
+                finally:
+                    join_pool.closeall()
+                counters["join_updated"]=join_summary["updated"]
+                counters["join_unmatched"]=join_summary["unmatched"]
+                self.__printMsg("Info", " Phase3: Spatail join is performed for "+ geoentity+", unmatched children: "+str(join_summary["unmatched"]))
+            else:
+                self.__printMsg("Info"," Phase3: spatailjoin_flag is false, parent assignment skipped for "+geoentity)
+            self.__printMsg("Info", " Phase3 Process Completed for "+ geoentity)
+
+        return geoentity_source_id, counters
+
+
+    def config_complete(self,geoentity_config):
         """
         Purpose
         ----------
-        This method will give ST_GeomFromGeoJSON fn string based on coordinate info from geojson row and can be used as geom in insert query.
+        This method will check that none of the source and file parameters of a geoentity config is None or empty,
+        an incomplete key is reported and passes the previous parent id on to the next key.
+        """
+        try:
+            source=geoentity_config["geoentity_source"]
+            file_config=geoentity_config["geoentity_config"]["geoJSON_file_config"]
+            config_var_list=[source["name"],source["publish_date_yyyymmdd"],source["project"],source["provider"],source["category"],file_config["file_path"],file_config["parent_type"],file_config["parent_geoentity_source_id"],file_config["prefix_identifier"],file_config["geoJSON_info_attribute"]["name"],file_config["geoJSON_info_attribute"]["feature_ID"]]
+        except (KeyError,TypeError):
+            return False
+        return not ((None in config_var_list) or ("" in config_var_list))
 
-        Parameters
+
+    def existing_source_id(self,cur,geoentity_config,geoentity_source_table="geoentity_source"):
+        """
+        Purpose
         ----------
-        wkt : WKT of Geometry
+        This method will give the id of the geoentity_source row of a geoentity config (same name,
+        publish date, project, provider and category as the Phase-1 insertion), None when not ingested yet.
+        """
+        source=geoentity_config["geoentity_source"]
+        publish_date=time.mktime(datetime.datetime.strptime(source["publish_date_yyyymmdd"], "%Y%m%d").timetuple())
+        cur.execute("select id from "+geoentity_source_table+" where name=%s and publish_date=%s and project=%s and provider=%s and category=%s",
+                    (source["name"],publish_date,source["project"],source["provider"],source["category"]))
+        row=cur.fetchone()
+        return None if row is None else row[0]
+
+
+    def ingestion_dependencies(self,keys,geoentity_configs,cur=None,geoentity_source_table="geoentity_source"):
+        """
+        Purpose
+        ----------
+        This method will give the key each geoentity key has to wait for: parent_geoentity_source_id -1
+        inherits the source id of the previous key, an existing (>0) source id waits for the key of the
+        batch re-ingesting that source (looked up with cur), 0 does not depend on any key. An incomplete
+        config waits for the previous key too, it passes that key's source id on as in a sequential run.
 
         Returns
         -------
-        Geom WKT String
-        """        
-        return "ST_GeomFromText(\'"+str(wkt)+"\',4326)"
-    
-    #------------------------------------#
-    # Main Methods for execution         #
-    #------------------------------------#
+        Dict key -> key it depends on or None
+        """
+        source_keys={}
+        if cur is not None:
+            for geoentity in keys:
+                try:
+                    source_id=self.existing_source_id(cur,geoentity_configs[geoentity],geoentity_source_table)
+                except (KeyError,ValueError,TypeError):
+                    #incomplete config, reported when the key itself is ingested
+                    continue
+                if source_id is not None:
+                    source_keys.setdefault(source_id,geoentity)
+        dependencies={}
+        for index,geoentity in enumerate(keys):
+            parent_id=geoentity_configs[geoentity]["geoentity_config"]["geoJSON_file_config"]["parent_geoentity_source_id"]
+            if (parent_id==-1 or not self.config_complete(geoentity_configs[geoentity])) and index>0:
+                dependencies[geoentity]=keys[index-1]
+            elif parent_id>0 and source_keys.get(parent_id) not in (None,geoentity):
+                dependencies[geoentity]=source_keys[parent_id]
+            else:
+                dependencies[geoentity]=None
+        return dependencies
+
+
+    def dependency_cycles(self,dependencies):
+        """
+        Purpose
+        ----------
+        This method will give the keys of ingestion_dependencies waiting on each other in a loop, they can never start.
+        """
+        cycles=set()
+        for geoentity in dependencies:
+            chain=[]
+            current=geoentity
+            while current is not None and current not in chain and current not in cycles:
+                chain.append(current)
+                current=dependencies[current]
+            if current in chain:
+                cycles.update(chain[chain.index(current):])
+        return cycles
+
+
+    def ingest_parallel(self,keys,geoentity_configs,database_config,workers=2,**ingest_kwargs):
+        """
+        Purpose
+        ----------
+        This method will ingest the geoentity keys concurrently on at most workers connections,
+        a key starts as soon as the key it depends on (ingestion_dependencies) has finished.
+
+        Returns
+        -------
+        Dict key -> (geoentity_source_id, counters), a failed key and the keys depending on it get (None, None)
+        """
+        pool=db_pool.PooledDB(database_config["db"],database_config["username"],database_config["password"],database_config["host"],database_config["port"],maxconn=workers,statement_timeout_ms=0)
+        with pool.connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                dependencies=self.ingestion_dependencies(keys,geoentity_configs,cur,database_config["geoentity_source_table"])
+        results={}
+        #keys that did not run to the end, their dependents are skipped
+        failed=self.dependency_cycles(dependencies)
+        for geoentity in keys:
+            if geoentity in failed:
+                self.__printMsg("Error"," "+geoentity+" skipped, its parent_geoentity_source_id waits in a loop on: "+", ".join(key for key in keys if key in failed))
+                results[geoentity]=(None,None)
+
+        def run(geoentity,previous_parent_id):
+            with pool.connection(autocommit=True) as conn:
+                with conn.cursor() as cur:
+                    return self.ingest_geoentity(cur,geoentity,geoentity_configs[geoentity],database_config,previous_parent_id,**ingest_kwargs)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers,thread_name_prefix="geoentity") as executor:
+                running={}
+                pending=[geoentity for geoentity in keys if geoentity not in results]
+                while pending or running:
+                    for geoentity in list(pending):
+                        dependency=dependencies[geoentity]
+                        if dependency is None:
+                            running[executor.submit(run,geoentity,None)]=geoentity
+                            pending.remove(geoentity)
+                        elif dependency in results:
+                            pending.remove(geoentity)
+                            #an incomplete config passes the previous parent id on, even None, as in a sequential run
+                            if dependency in failed or (results[dependency][0] is None and self.config_complete(geoentity_configs[dependency])):
+                                self.__printMsg("Error"," "+geoentity+" skipped, its parent "+dependency+" failed.")
+                                results[geoentity]=(None,None)
+                                failed.add(geoentity)
+                            else:
+                                running[executor.submit(run,geoentity,results[dependency][0])]=geoentity
+                    if not running:
+                        continue
+                    done,_=wait(running,return_when=FIRST_COMPLETED)
+                    for future in done:
+                        geoentity=running.pop(future)
+                        try:
+                            results[geoentity]=future.result()
+                        except BaseException as e:
+                            #sys.exit() of a failed key ends its thread only
+                            self.__printMsg("Error"," Ingestion of "+geoentity+" failed: "+repr(e))
+                            results[geoentity]=(None,None)
+                            failed.add(geoentity)
+                        self.__printMsg("Info"," "+geoentity+" finished with source id "+str(results[geoentity][0]))
+        finally:
+            pool.closeall()
+        return results
+
+
     def main(self,config='config.json'):    
         self.__printMsg('Info',"====== GeoEntity ingestion  execution is started. ======")
         self.__printMsg('Info', "Config file is loading.")
@@ -135,9 +431,9 @@ class GeoEntityIngest:
         password=__Config["global_param"]["database"]["password"]
         port=__Config["global_param"]["database"]["port"]
         db=__Config["global_param"]["database"]["db"]        
-        geoentity_table=__Config["global_param"]["database"]["geoentity_table"]
-        geoentity_source_table=__Config["global_param"]["database"]["geoentity_source_table"]
-        geoentity_source_seq=__Config["global_param"]["database"]["geoentity_source_seq"]
+        batch_size=__Config["global_param"].get("ingestion",{}).get("batch_size",geoentity_bulk_loader.DEFAULT_BATCH_SIZE)
+        spatial_join_workers=__Config["global_param"].get("ingestion",{}).get("spatial_join_workers",spatial_join.DEFAULT_WORKERS)
+        parallel_entities=__Config["global_param"].get("ingestion",{}).get("parallel_entities",1)
         
         
         #Execution with Config Param Loading       
@@ -155,184 +451,14 @@ class GeoEntityIngest:
                 conn.close()
             self.__printMsg('Error',"====== GeoEntity ingestion execution is failed due to database connection. ======")
             sys.exit()   
-        previous_parent_id=None
-        for geoentity in __GeoEntityIngestConfig["geoentity_keys_to_process"]:
-        
-            #SourceInfo Loading
-            source_name=__GeoEntityIngestConfig[geoentity]["geoentity_source"]["name"]
-            source_publish_date_yyyymmdd=time.mktime(datetime.datetime.strptime(__GeoEntityIngestConfig[geoentity]["geoentity_source"]["publish_date_yyyymmdd"], "%Y%m%d").timetuple())
-            source_project=__GeoEntityIngestConfig[geoentity]["geoentity_source"]["project"]
-            source_provider=__GeoEntityIngestConfig[geoentity]["geoentity_source"]["provider"]
-            source_category=__GeoEntityIngestConfig[geoentity]["geoentity_source"]["category"]
-            source_aux=__GeoEntityIngestConfig[geoentity]["geoentity_source"]["aux_data"]
-                       
-            #ConfigInfo Loading
-            config_geojsonfile_file_path=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["file_path"]
-            config_geojsonfile_parent_type=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["parent_type"]
-            config_geojsonfile_parent_geoent_source_id=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["parent_geoentity_source_id"]
-            config_geojsonfile_prefix_identifier=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["prefix_identifier"]
-            config_geojsonfile_infoattr_name=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["name"]
-            config_geojsonfile_infoattr_featureid=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["feature_ID"]
-            config_geojsonfile_infoattr_featureid_type="str"
-            if "feature_ID_type" in __GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]:
-                config_geojsonfile_infoattr_featureid_type=__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["feature_ID_type"]
-
-            if (previous_parent_id is not None) and (config_geojsonfile_parent_geoent_source_id==-1):
-                config_geojsonfile_parent_geoent_source_id=previous_parent_id
-                self.__printMsg("Info"," Previous parent id:"+str(previous_parent_id)+" is set for geoentity: "+geoentity)
-            elif (config_geojsonfile_parent_geoent_source_id==-1):
-                self.__printMsg("Error","First element and incase of parent insertion failure parent_id can't be inherited. please check parent_geoentity_source_id configuration for geoentity: "+geoentity)
-                sys.exit()
-                
-            #None Checking for Parameters
-            config_var_list=[source_name,source_publish_date_yyyymmdd,source_project,source_provider,source_category,config_geojsonfile_file_path,config_geojsonfile_parent_type,config_geojsonfile_parent_geoent_source_id,config_geojsonfile_prefix_identifier,config_geojsonfile_infoattr_name,config_geojsonfile_infoattr_featureid]
-            if (None in config_var_list) or ("" in config_var_list) :
-                self.__printMsg('Error', "=====Configuration error, please see config once for "+geoentity+" ======")
-                continue  
-            else:
-                config_var_list=None
-            self.__printMsg('Info', geoentity+" Parameters(Global and Config) loaded successfully.")
-            
-            
-            #Phase 1: Insertion Algo - Source Insertion
-            self.__printMsg("Info", "Phase-1: GeoEntity Source Insertion Started.")
-            geoentity_source_id=None
-            source_insertion_query=None
-            if not(source_aux=="NULL" or source_aux=="null" or source_aux=="Null" or source_aux==""):
-                source_aux="'"+source_aux+"'"
-            else:
-                source_aux="NULL"
-                
-          #-----If duplicate exist then return id for phase-2 execution      
-            try:
-                cur.execute("SELECT setval('"+geoentity_source_seq+"', max(id)) from "+geoentity_source_table)
-                if(config_geojsonfile_parent_geoent_source_id>0):
-                    source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata,parent_source_id) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+","+str(config_geojsonfile_parent_geoent_source_id)+") returning id;"
-                else:
-                    source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+") returning id;"
-                self.__printMsg('Info', source_insertion_query)
-                cur.execute(source_insertion_query)
-                if(cur.rowcount<1): #0 row
-                    self.__printMsg('Error', "=====(Phase1) Source insertion failed for "+geoentity+" ======")
-                    continue
-                else:                
-                    geoentity_source_id=cur.fetchone()[0]
-                    self.__printMsg('Info', " (Phase1) Source Insertion Completed Successfully.")    
-            except psycopg2.Error as e:
-                
-                if "duplicate" in e.pgerror:
-                    self.__printMsg('Error', "=====(Phase1) Already Source is existing for "+geoentity+" ======")
-                    if __GeoEntityIngestConfig[geoentity]["geoentity_source"]["reprocess_flag"]:
-                        source_id_query="select id from "+geoentity_source_table+" where name='"+source_name+"' and publish_date="+str(source_publish_date_yyyymmdd)+" and project='"+source_project+"' and provider='"+source_provider+"' and category='"+source_category+"'"
-                        cur.execute(source_id_query)
-                        geoentity_source_id=cur.fetchone()[0]
-                    else:
-                        sys.exit()
-                else:
-                    self.__printMsg('Error', " Phase1 Source Insertion for <"+geoentity+"> has been failed.")
-                    previous_parent_id=None
-                    continue
-            self.__printMsg("Info", "Phase1: GeoEntity Source Processing Completed Successfully.")
-            
-            
-            #Phase 2: Insertion Algo - GeoEntity Insertion
-            self.__printMsg("Info", "Phase-2: GeoEntity Insertion Started.")
-            previous_parent_id=geoentity_source_id
-            gdf = None
-            total_records=0
-            processed_record=0
-            failed_record=0
-            try:
-                gdf = gpd.read_file(config_geojsonfile_file_path)
-                gdf.set_crs(epsg=4326, inplace=True, allow_override=True)
-                self.__printMsg("Info"," Reading of "+geoentity+" geojson file has been completed.")
-                total_records=gdf.shape[0]
-                self.__printMsg("Info"," In "+geoentity+" total records for processing:"+str(total_records))
-            except:
-                self.__printMsg("Error", "Phase2 Sorry reading error for "+geoentity+" geojson file, please check the file once.")
-                previous_parent_id=None
-                continue
-           
-            for i,row in gdf.iterrows():
-                # if i<2288559:
-                #    continue   
-
-                geoentity_id=config_geojsonfile_prefix_identifier+GeoEntityIngest.__getGeoEntityID(config_geojsonfile_infoattr_featureid,row,config_geojsonfile_infoattr_featureid_type)#--
-                geoentity_name=row[config_geojsonfile_infoattr_name]#--  
-                #print("geoname", geoentity_name, type(geoentity_name))   
-
-                if(geoentity_name and (not isinstance(geoentity_name,float) or not math.isnan(geoentity_name))):
-                    #print('i:',str(i),'geoentity_id:',geoentity_id,'geoentity_name:',geoentity_name)
-                    geoentity_name=geoentity_name.replace("'","")
-                else:
-                    continue
+        if parallel_entities>1:
+            #Independent keys run concurrently, -1 children wait for the key before them only
+            self.ingest_parallel(__GeoEntityIngestConfig["geoentity_keys_to_process"],__GeoEntityIngestConfig,__Config["global_param"]["database"],parallel_entities,batch_size=batch_size,spatial_join_workers=spatial_join_workers)
+        else:
+            previous_parent_id=None
+            for geoentity in __GeoEntityIngestConfig["geoentity_keys_to_process"]:
+                previous_parent_id, counters=self.ingest_geoentity(cur,geoentity,__GeoEntityIngestConfig[geoentity],__Config["global_param"]["database"],previous_parent_id,batch_size=batch_size,spatial_join_workers=spatial_join_workers)
 
-                geoentity_geom=GeoEntityIngest.__getGeom(row.geometry.wkt)                
-                geoentity_insertion_query=None
-                if (config_geojsonfile_parent_geoent_source_id>0):
-                    geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,parent_geoentity_source_id) values ({0},'{1}','{2}',{3},{4})".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,config_geojsonfile_parent_geoent_source_id)
-                    if "geoJSON_aux_attributes" in __GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]:
-                        geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,parent_geoentity_source_id,auxdata) values ({0},'{1}','{2}',{3},{4},'{5}')".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,config_geojsonfile_parent_geoent_source_id,self.__get_aux_data(__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_aux_attributes"],row))
-                else:
-                    geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom) values ({0},'{1}','{2}',{3})".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom)                            
-                    if "geoJSON_aux_attributes" in __GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]:
-                        geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,auxdata) values ({0},'{1}','{2}',{3},'{4}')".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,self.__get_aux_data(__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["geoJSON_aux_attributes"],row))                            
-                try:
-                    cur.execute(geoentity_insertion_query)
-                    if cur.rowcount == 1:
-                        processed_record=processed_record+1        
-                    else:
-                        failed_record=failed_record+1
-                except psycopg2.Error as e:
-                    if "duplicate" in e.pgerror:
-                        if __GeoEntityIngestConfig[geoentity]["geoentity_source"]["reprocess_flag"]:
-                            processed_record=processed_record+1
-                            continue
-                        else:
-                            sys.exit()
-                    else:
-                        self.__printMsg("Error", e.pgerror)
-                        
-            self.__printMsg("Info"," Phase2 GeoEntity Insertion: Successfully processed records:"+str(processed_record))
-            self.__printMsg("Info"," Phase2 GeoEntity Insertion: Failed Records:"+str(failed_record)+" \n")
-            self.__printMsg("Info", "Phase2: GeoEntity Insertion Successfully Completed.")
-                
-            
-            #Phase3: Spaitail Join 
-            #Phase3: Parent Condition Checking
-            if (config_geojsonfile_parent_geoent_source_id!=0):
-                self.__printMsg("Info"," Phase3: Spatial join statred.")
-                #geoentity_parent_update_query="UPDATE "+geoentity_table+" SET geoentity_id=CONCAT(parent.geoentity_id,"+geoentity_table+".geoentity_id), parent_id=parent.geoentity_id, parent_name=parent.name FROM (SELECT geoentity_id, name,ST_Buffer(geom::geography,2000)::geometry as geom FROM "+geoentity_table+" where geoentity_source_id="+str(config_geojsonfile_parent_geoent_source_id)+") parent WHERE geoentity_source_id="+str(geoentity_source_id)+" and geoentity.parent_geoentity_source_id="+str(config_geojsonfile_parent_geoent_source_id)+" and ST_Contains(parent.geom,geoentity.geom);"
-                geoentity_parent_update_query="UPDATE "+geoentity_table+" AS child SET geoentity_id = CONCAT(parent.geoentity_id, child.geoentity_id), parent_id = parent.geoentity_id, parent_name = parent.name, parent_geoentity_source_id = parent.geoentity_source_id FROM (SELECT geoentity_source_id, geoentity_id, name, geom FROM  "+geoentity_table+" WHERE geoentity_source_id = "+str(config_geojsonfile_parent_geoent_source_id)+") AS parent WHERE child.geoentity_source_id = "+str(geoentity_source_id)+" AND ST_Intersects(parent.geom, child.geom) AND ST_Contains(parent.geom, ST_Centroid(child.geom))";                
-                #If parent name is set then update query will not be executed
-                update_test_query="SELECT COUNT(*) FROM geoentity where geoentity_source_id = "+str(geoentity_source_id)+" and parent_name is not NULL; "
-                cur.execute(update_test_query)
-                noof_updated_rows=cur.fetchone()[0]
-                if noof_updated_rows<1:
-                    command="psql -h "+host+" -U "+username+" -d "+db+" -p "+str(port)+" -c \""+geoentity_parent_update_query+"\""
-                    if(__GeoEntityIngestConfig[geoentity]["geoentity_config"]["geoJSON_file_config"]["spatailjoin_flag"]):
-                        os.system(command)
-                    else:
-                        self.__printMsg("Info","Updte Query is: "+geoentity_parent_update_query)
-                    self.__printMsg("Info", " Phase3: Spatail join is performed for "+ geoentity)
-                else:
-                    self.__printMsg(geoentity_parent_update_query)                 
-                self.__printMsg("Info", " Phase3 Process Completed for "+ geoentity) 
-                
-               
-            #Local Variable Reset to None
-            source_name=None
-            source_publish_date_yyyymmdd=None
-            source_project=None
-            source_provider=None
-            source_category=None
-            source_aux=None            
-            config_geojsonfile_file_path=None
-            config_geojsonfile_parent_type=None
-            config_geojsonfile_parent_geoent_source_id=None
-            config_geojsonfile_prefix_identifier=None
-            config_geojsonfile_infoattr_name=None
-            config_geojsonfile_infoattr_featureid=None
         if conn is not None:    
             cur.close()
             conn.close()
@@ -342,4 +468,4 @@ class GeoEntityIngest:
 
 if __name__ == "__main__":
     MainObj=GeoEntityIngest()    
-    MainObj.main(sys.argv[1])    
+    MainObj.main(sys.argv[1])
@@ -1,25 +1,32 @@
 from flask import Flask, render_template, redirect, url_for, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
+import gzip
 import json
-import requests
-import geopandas as gpd
-import psycopg2
 import os
-import time
-from datetime import datetime
-from zoneinfo import ZoneInfo
-import sys
-import math
-import paramiko
-import sqlite3
 import threading
-import uuid
+import time
 import ijson
 import traceback
+from concurrent.futures.process import BrokenProcessPool
+import geoentity_bulk_loader
+import ingestion_worker
+import pyramid_engine
+import source_manifest
+from feature_ids import DigestSet, feature_id_digest
+import tile_server
+import tile_store
+import geometry_api
+from sftp_pool import SFTPPool
+from upload_stream import SFTPUploadStream, UploadRequest
+from remote_config import RemoteConfigCache
+from source_catalog import SourceCatalog
+from ttl_cache import cached_json_response
+import db_pool as pg_pool
+from job_store import init_db, update_job, get_job_status, list_jobs, latest_job, add_job_event, get_job_events, get_manifest
+from job_scheduler import JobScheduler
 
 app = Flask(__name__)
-
-DB_PATH = 'job_status.db'
+app.request_class = UploadRequest
 
 load_dotenv()
 REMOTE_IP = os.getenv("REMOTE_IP")
@@ -36,6 +43,53 @@ geoentity_table = os.getenv("GEOENTITY_TABLE")
 geoentity_source_table = os.getenv("GEOENTITY_SOURCE_TABLE")
 geoentity_source_seq = os.getenv("GEOENTITY_SOURCE_SEQ")
 
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", geoentity_bulk_loader.DEFAULT_BATCH_SIZE))
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", 2))
+SPATIAL_JOIN_WORKERS = int(os.getenv("SPATIAL_JOIN_WORKERS", 4))
+PYRAMID_PARALLELISM = int(os.getenv("PYRAMID_PARALLELISM", pyramid_engine.DEFAULT_PARALLELISM))
+PYRAMID_MODE = os.getenv("PYRAMID_MODE", "levels")
+# Skip unchanged republishes and ingest only the changed features, see source_manifest
+USE_SOURCE_MANIFEST = os.getenv("USE_SOURCE_MANIFEST", "true").lower() == "true"
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", 300))
+# Low zooms are seeded to the tile store after every pyramid build, 0 disables seeding
+TILE_SEED_MAX_ZOOM = int(os.getenv("TILE_SEED_MAX_ZOOM", tile_store.DEFAULT_SEED_MAX_ZOOM))
+SFTP_READ_BUFSIZE = 1024 * 1024
+DUPLICATE_REPORT_LIMIT = 20
+
+sftp_pool = None
+config_cache = None
+source_catalog = None
+db_pool = None
+tile_cache = None
+disk_tiles = None
+job_scheduler = None
+
+
+def init_resources():
+    """
+    Opens the pools, caches and stores shared by the routes and creates the job tables.
+    Not run when a spawned ingestion worker re-imports this script as __mp_main__ (python app.py),
+    the workers open their own connections (ingestion_worker.run_ingestion).
+    """
+    global sftp_pool, config_cache, source_catalog, db_pool, tile_cache, disk_tiles, job_scheduler
+    # Shared SFTP sessions for routes and workers, avoids an SSH handshake per call
+    sftp_pool = SFTPPool(REMOTE_IP, REMOTE_USER, REMOTE_PASS,
+                         max_size=int(os.getenv("SFTP_POOL_SIZE", 4)),
+                         idle_timeout=int(os.getenv("SFTP_POOL_IDLE_TIMEOUT", 300)))
+    config_cache = RemoteConfigCache(sftp_pool)
+    # geoentity-sources catalog served locally (GEOENTITY_SOURCES_URL, GEOENTITY_SOURCES_TTL, GEOENTITY_SOURCES_CACHE_FILE)
+    source_catalog = SourceCatalog()
+    # Shared PostgreSQL connections (DB_POOL_MIN, DB_POOL_MAX, DB_STATEMENT_TIMEOUT_MS)
+    db_pool = pg_pool.pool_from_env()
+    # Rendered vector tiles kept in memory (bytes, least recently used evicted first)
+    tile_cache = tile_server.TileCache(int(os.getenv("TILE_CACHE_BYTES", tile_server.DEFAULT_CACHE_BYTES)))
+    # Tiles on disk (TILE_DB_PATH)
+    disk_tiles = tile_store.TileStore()
+    init_db()
+    # Republish jobs run on a fixed number of workers instead of a thread per request
+    job_scheduler = JobScheduler(max_workers=int(os.getenv("JOB_WORKERS", 2)), name="republish-worker")
+
+
 def __printMsg(opt,text):
     """
     Purpose
@@ -61,102 +115,27 @@ def __printMsg(opt,text):
         print("Unsupported option "+opt+" for prinitng.")
 
 
-def __get_aux_data(attributes_array,row):
-    returnobj={'features':{}}
-    for att in attributes_array:
-        if 'Level_IV' in att:
-            returnobj['features']['Level_lV']=str(row[att])
-        else:
-            returnobj['features'][att]=str(row[att])
-
-    return json.dumps(returnobj)
-
-
-def __getGeoEntityID(GeoEntityIDKeys,row,type):
-    """
-    Purpose
-    ----------
-    This method will give ID of GeoEntity
-
-    Parameters
-    ----------
-    ZoneIDKeys : Ordered Arrays for Key Parsing
-    row : GeoJSON row for dataset extraction
-
-    Returns
-    -------
-    zoneid : String contain ZoneID
-    """
-    if type=="Int":
-        return str(int(row[GeoEntityIDKeys]))
-    else:
-        return str(row[GeoEntityIDKeys])
-
-
-def __getGeom(wkt):
+def read_data(file_path):
     """
-    Purpose
-    ----------
-    This method will give ST_GeomFromGeoJSON fn string based on coordinate info from geojson row and can be used as geom in insert query.
-
-    Parameters
-    ----------
-    wkt : WKT of Geometry
-
-    Returns
-    -------
-    Geom WKT String
+    Reads the first feature of a remote GeoJSON file and returns its non-geometry column names.
+    The file is streamed, only the first feature is parsed.
     """
-    return "ST_GeomFromText(\'"+str(wkt)+"\',4326)"
-
-
-def read_data(file_path, return_columns_only=False):
-    """
-    Reads a GeoJSON file from remote path using Paramiko.
-    If return_columns_only=True, returns only the non-geometry column names.
-    Otherwise, returns a full GeoDataFrame (original behavior).
-    """
-
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-    sftp = ssh.open_sftp()
 
     geojson_columns = []
 
-    try:
+    with sftp_pool.session() as sftp:
         with sftp.open(file_path, 'r') as remote_file:
-            if return_columns_only:
-                # Stream JSON to get the first feature's properties
-                parser = ijson.items(remote_file, 'features.item')
-                first_feature = next(parser, None)
-                if first_feature:
-                    geojson_columns = list(first_feature.get('properties', {}).keys())
-                return geojson_columns
-            else:
-                geojson_text = remote_file.read()  # full load
-                geojson_obj = json.loads(geojson_text)
-                gdf = gpd.GeoDataFrame.from_features(geojson_obj["features"])
-                return gdf
-
-    finally:
-        sftp.close()
-        ssh.close()
+            parser = ijson.items(remote_file, 'features.item')
+            first_feature = next(parser, None)
+            if first_feature:
+                geojson_columns = list(first_feature.get('properties', {}).keys())
+    return geojson_columns
 
 
 def parse_config(config_path, target_key):
-    # Reads config.json from remote, searches for target_key, returns that section.
-
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-    sftp = ssh.open_sftp()
-
-    with sftp.open(config_path, 'r') as remote_file:
-        config_data = json.load(remote_file)
+    # Reads config.json from remote (cached until its mtime/size changes), searches for target_key, returns that section.
 
-    sftp.close()
-    ssh.close()
+    config_data = config_cache.get(config_path)
 
     if "config" in config_data and target_key in config_data["config"]:
         return config_data["config"][target_key]
@@ -164,370 +143,138 @@ def parse_config(config_path, target_key):
         return None
 
 
+def scan_feature_ids(file_path, feature_id_key, name_key=None, report_limit=DUPLICATE_REPORT_LIMIT):
+    """
+    Single streaming pass over a remote GeoJSON file which only looks at the
+    feature_ID (and name) property of each feature, no GeoDataFrame is built.
+    Seen ids are kept as 64 bit blake2b digests in a DigestSet (equal values like
+    1 and 1.0 are one id as in pandas duplicated), the first report_limit duplicate
+    ids are returned.
+    """
+
+    id_prefix = "features.item.properties." + feature_id_key
+    name_prefix = "features.item.properties." + name_key if name_key else None
+    seen = DigestSet()
+    duplicate_ids = []
+    summary = {"features": 0, "duplicates": 0, "missing_ids": 0, "missing_names": 0}
+
+    def finish_feature(feature_id, has_name):
+        if feature_id is None:
+            summary["missing_ids"] += 1
+            return
+        if name_prefix and not has_name:
+            summary["missing_names"] += 1
+        if not seen.add(feature_id_digest(feature_id)):
+            summary["duplicates"] += 1
+            if len(duplicate_ids) < report_limit:
+                duplicate_ids.append(feature_id)
+
+    with sftp_pool.session() as sftp:
+        with sftp.open(file_path, 'r', bufsize=SFTP_READ_BUFSIZE) as remote_file:
+            feature_id = None
+            has_name = False
+            for prefix, event, value in ijson.parse(remote_file, use_float=True, buf_size=SFTP_READ_BUFSIZE):
+                if prefix == "features.item":
+                    if event == "start_map":
+                        feature_id = None
+                        has_name = False
+                    elif event == "end_map":
+                        summary["features"] += 1
+                        finish_feature(feature_id, has_name)
+                elif prefix == id_prefix and event in ("string", "number"):
+                    feature_id = value
+                elif prefix == name_prefix and event == "string" and value:
+                    has_name = True
+
+    summary["duplicate_ids"] = duplicate_ids
+    return summary
+
+
 def validate_geojson(entity_key):
     entity_data = parse_config(REMOTE_CONFIG_PATH, entity_key)
     if not entity_data:
         return False, "Key not found in config"
 
     geojson_path = entity_data["geoentity_config"]["geoJSON_file_config"]["file_path"]
-    gdf = read_data(geojson_path)
 
-    geoentity_feature_id = entity_data["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["feature_ID"]
+    # A file untouched since its last successful ingestion with the same config was validated then, no need to download it again
+    manifest = get_manifest(entity_key) if USE_SOURCE_MANIFEST else None
+    if manifest and manifest["file_path"] == geojson_path and manifest["config_hash"] == source_manifest.config_hash(entity_data):
+        with sftp_pool.session() as sftp:
+            attributes = sftp.stat(geojson_path)
+        if manifest["file_size"] == attributes.st_size and manifest["file_mtime"] == attributes.st_mtime:
+            print(f"{entity_key} geojson file unchanged since the last ingestion, validation skipped")
+            return True, None
+
+    info_attribute = entity_data["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]
+    geoentity_feature_id = info_attribute["feature_ID"]
     print(f"The feature id is - {geoentity_feature_id}")
-    # if "geoentity_feature_id" not in gdf.columns:
-    #     return False, f"Missing {geoentity_feature_id} column"
 
-    duplicates = gdf[gdf.duplicated(subset=geoentity_feature_id, keep=False)]
-    if not duplicates.empty:
-        duplicate_ids = duplicates[geoentity_feature_id].tolist()
+    summary = scan_feature_ids(geojson_path, geoentity_feature_id, info_attribute.get("name"))
+    print(f"Scanned {summary['features']} features, {summary['duplicates']} duplicates, {summary['missing_ids']} without id, {summary['missing_names']} without name")
+    if summary["features"] == 0:
+        return False, "No features found in geojson file"
+
+    if summary["duplicates"]:
+        duplicate_ids = summary["duplicate_ids"]
         print(f"Duplicate values {duplicate_ids}")
-        return False, f"Duplicate 'geoentity_feature_id' values found: {duplicate_ids}"
+        return False, f"{summary['duplicates']} duplicate 'geoentity_feature_id' values found, first {len(duplicate_ids)}: {duplicate_ids}"
 
     return True, None
 
 
-def insertion(gdf, geoentity_config, geoentity):
-    try:
-        conn=None
-        cur=None
-        try:
-            conn=psycopg2.connect(database=db, user=username, password=password, host=host, port=port)
-            conn.autocommit = True
-            cur= conn.cursor()
-        except:
-            __printMsg("Error"," DB Error, Please check DB Configuration once.")
-            if conn is not None:
-                cur.close()
-                conn.close()
-            __printMsg('Error',"====== GeoEntity ingestion execution is failed due to database connection. ======")
-            sys.exit()
-
-        previous_parent_id=None
-
-
-        # SourceInfo Loading
-        source_name = geoentity_config["geoentity_source"]["name"]
-        source_publish_date_yyyymmdd = time.mktime(datetime.strptime(
-            geoentity_config["geoentity_source"]["publish_date_yyyymmdd"], "%Y%m%d").timetuple())
-        source_project = geoentity_config["geoentity_source"]["project"]
-        source_provider = geoentity_config["geoentity_source"]["provider"]
-        source_category = geoentity_config["geoentity_source"]["category"]
-        source_aux = geoentity_config["geoentity_source"]["aux_data"]
-
-        # ConfigInfo Loading
-        config_geojsonfile_file_path = geoentity_config["geoentity_config"]["geoJSON_file_config"]["file_path"]
-        config_geojsonfile_parent_type = geoentity_config["geoentity_config"]["geoJSON_file_config"]["parent_type"]
-        config_geojsonfile_parent_geoent_source_id = geoentity_config["geoentity_config"]["geoJSON_file_config"]["parent_geoentity_source_id"]
-        config_geojsonfile_prefix_identifier = geoentity_config["geoentity_config"]["geoJSON_file_config"]["prefix_identifier"]
-        config_geojsonfile_infoattr_name = geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["name"]
-        config_geojsonfile_infoattr_featureid = geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["feature_ID"]
-        config_geojsonfile_infoattr_featureid_type = "str"
-        if "feature_ID_type" in geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]:
-            config_geojsonfile_infoattr_featureid_type = geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_info_attribute"]["feature_ID_type"]
-
-        if (previous_parent_id is not None) and (config_geojsonfile_parent_geoent_source_id==-1):
-            config_geojsonfile_parent_geoent_source_id=previous_parent_id
-            __printMsg("Info"," Previous parent id:"+str(previous_parent_id)+" is set for geoentity: "+geoentity)
-        elif (config_geojsonfile_parent_geoent_source_id==-1):
-            __printMsg("Error","First element and incase of parent insertion failure parent_id can't be inherited. please check parent_geoentity_source_id configuration for geoentity: "+geoentity)
-            sys.exit()
-
-
-        #None Checking for Parameters
-        config_var_list=[source_name,source_publish_date_yyyymmdd,source_project,source_provider,source_category,config_geojsonfile_file_path,config_geojsonfile_parent_type,config_geojsonfile_parent_geoent_source_id,config_geojsonfile_prefix_identifier,config_geojsonfile_infoattr_name,config_geojsonfile_infoattr_featureid]
-        if (None in config_var_list) or ("" in config_var_list) :
-            __printMsg('Error', "=====Configuration error, please see config once for "+geoentity+" ======")
-        else:
-            config_var_list=None
-        __printMsg('Info', geoentity+" Parameters(Global and Config) loaded successfully.")
-
-        #Phase 1: Insertion Algo - Source Insertion
-        __printMsg("Info", "Phase-1: GeoEntity Source Insertion Started.")
-        geoentity_source_id=None
-        source_insertion_query=None
-        if not(source_aux=="NULL" or source_aux=="null" or source_aux=="Null" or source_aux==""):
-            source_aux="'"+source_aux+"'"
-        else:
-            source_aux="NULL"
+def pyramid_pool():
+    # Builds and tile seeding get their own connections (one per bucket plus the coordinating one),
+    # the request pool stays free for /tiles and the other routes, concurrent jobs do not compete
+    return pg_pool.pool_from_env(minconn=0, maxconn=PYRAMID_PARALLELISM + 1, statement_timeout_ms=0)
 
 
-        #-----If duplicate exist then return id for phase-2 execution
-        try:
-            cur.execute("SELECT setval('"+geoentity_source_seq+"', max(id)) from "+geoentity_source_table)
-            if(config_geojsonfile_parent_geoent_source_id>0):
-                source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata,parent_source_id) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+","+str(config_geojsonfile_parent_geoent_source_id)+") returning id;"
-            else:
-                source_insertion_query="INSERT INTO "+geoentity_source_table+"(name, publish_date, project, provider, category,auxdata) VALUES ('"+source_name+"', "+str(source_publish_date_yyyymmdd)+", '"+source_project+"', '"+source_provider+"', '"+source_category+"', "+source_aux+") returning id;"
-            __printMsg('Info', source_insertion_query)
-            cur.execute(source_insertion_query)
-            if(cur.rowcount<1): #0 row
-                __printMsg('Error', "=====(Phase1) Source insertion failed for "+geoentity+" ======")
-            else:
-                geoentity_source_id=cur.fetchone()[0]
-                __printMsg('Info', " (Phase1) Source Insertion Completed Successfully.")
-        except psycopg2.Error as e:
-
-            if "duplicate" in e.pgerror:
-                __printMsg('Error', "=====(Phase1) Already Source is existing for "+geoentity+" ======")
-                print("flage issssssssssssssssss",geoentity_config["geoentity_source"]["reprocess_flag"])
-                if geoentity_config["geoentity_source"]["reprocess_flag"]:
-                    source_id_query="select id from "+geoentity_source_table+" where name='"+source_name+"' and publish_date="+str(source_publish_date_yyyymmdd)+" and project='"+source_project+"' and provider='"+source_provider+"' and category='"+source_category+"'"
-                    cur.execute(source_id_query)
-                    geoentity_source_id=cur.fetchone()[0]
-                else:
-                    sys.exit()
-            else:
-                __printMsg('Error', " Phase1 Source Insertion for <"+geoentity+"> has been failed.")
-                previous_parent_id=None
-        __printMsg("Info", "Phase1: GeoEntity Source Processing Completed Successfully.")
-
-
-        #Phase 2: Insertion Algo - GeoEntity Insertion
-        __printMsg("Info", "Phase-2: GeoEntity Insertion Started.")
-        previous_parent_id=geoentity_source_id
-        total_records=0
-        processed_record=0
-        failed_record=0
-        try:
-            gdf.set_crs(epsg=4326, inplace=True, allow_override=True)
-            __printMsg("Info"," Reading of "+geoentity+" geojson file has been completed.")
-            total_records=gdf.shape[0]
-            __printMsg("Info"," In "+geoentity+" total records for processing:"+str(total_records))
-        except:
-            __printMsg("Error", "Phase2 Sorry reading error for "+geoentity+" geojson file, please check the file once.")
-            previous_parent_id=None
-
-        for i,row in gdf.iterrows():
-            # if i<2288559:
-            #    continue
-
-            geoentity_id=config_geojsonfile_prefix_identifier+__getGeoEntityID(config_geojsonfile_infoattr_featureid,row,config_geojsonfile_infoattr_featureid_type)#--
-            geoentity_name=row[config_geojsonfile_infoattr_name]#--
-            #print("geoname", geoentity_name, type(geoentity_name))
-
-            if(geoentity_name and (not isinstance(geoentity_name,float) or not math.isnan(geoentity_name))):
-                #print('i:',str(i),'geoentity_id:',geoentity_id,'geoentity_name:',geoentity_name)
-                geoentity_name=geoentity_name.replace("'","")
-
-            geoentity_geom=__getGeom(row.geometry.wkt)
-            geoentity_insertion_query=None
-            if (config_geojsonfile_parent_geoent_source_id>0):
-                geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,parent_geoentity_source_id) values ({0},'{1}','{2}',{3},{4})".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,config_geojsonfile_parent_geoent_source_id)
-                if "geoJSON_aux_attributes" in geoentity_config["geoentity_config"]["geoJSON_file_config"]:
-                    geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,parent_geoentity_source_id,auxdata) values ({0},'{1}','{2}',{3},{4},'{5}')".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,config_geojsonfile_parent_geoent_source_id,__get_aux_data(geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_aux_attributes"],row))
-            else:
-                geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom) values ({0},'{1}','{2}',{3})".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom)                       
-                if "geoJSON_aux_attributes" in geoentity_config["geoentity_config"]["geoJSON_file_config"]:
-                    geoentity_insertion_query ="Insert into "+geoentity_table+"(geoentity_source_id, geoentity_id, name, geom,auxdata) values ({0},'{1}','{2}',{3},'{4}')".format(geoentity_source_id,geoentity_id,geoentity_name,geoentity_geom,__get_aux_data(geoentity_config["geoentity_config"]["geoJSON_file_config"]["geoJSON_aux_attributes"],row))
-            try:
-                cur.execute(geoentity_insertion_query)
-                if cur.rowcount == 1:
-                    processed_record=processed_record+1
-                else:
-                    failed_record=failed_record+1
-            except psycopg2.Error as e:
-                if "duplicate" in e.pgerror:
-                    if geoentity_config["geoentity_source"]["reprocess_flag"]:
-                        processed_record=processed_record+1
-                    else:
-                        sys.exit()
-                else:
-                    __printMsg("Error", e.pgerror)
-
-        __printMsg("Info"," Phase2 GeoEntity Insertion: Successfully processed records:"+str(processed_record))
-        __printMsg("Info"," Phase2 GeoEntity Insertion: Failed Records:"+str(failed_record)+" \n")
-        __printMsg("Info", "Phase2: GeoEntity Insertion Successfully Completed.")
-        if (config_geojsonfile_parent_geoent_source_id==0):
-            return True
-        else:
-
-
-
-
-        #Phase3: Spaitail Join
-        #Phase3: Parent Condition Checking
-        # if (config_geojsonfile_parent_geoent_source_id!=0):
-            __printMsg("Info"," Phase3: Spatial join statred.")
-            # geoentity_parent_update_query="UPDATE "+geoentity_table+" SET geoentity_id=CONCAT(parent.geoentity_id,"+geoentity_table+".geoentity_id), parent_id=parent.geoentity_id, parent_name=parent.name FROM (SELECT geoentity_id, name,ST_Buffer(geom::geography,2000)::geometry as geom FROM "+geoentity_table+" where geoentity_source_id="+str(config_geojsonfile_parent_geoent_source_id)+") parent WHERE geoentity_source_id="+str(geoentity_source_id)+" and geoentity.parent_geoentity_source_id="+str(config_geojsonfile_parent_geoent_source_id)+" and ST_Contains(parent.geom,geoentity.geom);"
-            geoentity_parent_update_query="UPDATE "+geoentity_table+" AS child SET geoentity_id = CONCAT(parent.geoentity_id, child.geoentity_id), parent_id = parent.geoentity_id, parent_name = parent.name, parent_geoentity_source_id = parent.geoentity_source_id FROM (SELECT geoentity_source_id, geoentity_id, name, geom FROM  "+geoentity_table+" WHERE geoentity_source_id = "+str(config_geojsonfile_parent_geoent_source_id)+") AS parent WHERE child.geoentity_source_id = "+str(geoentity_source_id)+" AND ST_Intersects(parent.geom, child.geom) AND ST_Contains(parent.geom, ST_Centroid(child.geom))";
-            #If parent name is set then update query will not be executed
-            update_test_query="SELECT COUNT(*) FROM geoentity where geoentity_source_id = "+str(geoentity_source_id)+" and parent_name is not NULL; "
-            cur.execute(update_test_query)
-            noof_updated_rows=cur.fetchone()[0]
-            if noof_updated_rows<1:
-                command="psql -h "+host+" -U "+username+" -d "+db+" -p "+str(port)+" -c \""+geoentity_parent_update_query+"\""
-                if(geoentity_config["geoentity_config"]["geoJSON_file_config"]["spatailjoin_flag"]):
-                    os.system(command)
-                else:
-                    __printMsg("Info","Updte Query is: "+geoentity_parent_update_query)
-                __printMsg("Info", " Phase3: Spatail join is performed for "+ geoentity)
-            else:
-                __printMsg(geoentity_parent_update_query)
-            __printMsg("Info", " Phase3 Process Completed for "+ geoentity)
-
-
-        #Local Variable Reset to None
-        source_name=None
-        source_publish_date_yyyymmdd=None
-        source_project=None
-        source_provider=None
-        source_category=None
-        source_aux=None
-        config_geojsonfile_file_path=None
-        config_geojsonfile_parent_type=None
-        config_geojsonfile_parent_geoent_source_id=None
-        config_geojsonfile_prefix_identifier=None
-        config_geojsonfile_infoattr_name=None
-        config_geojsonfile_infoattr_featureid=None
-
-        if conn is not None:
-            cur.close()
-            conn.close()
-        __printMsg('Info',"====== GeoEntity Execution Completed and and All DB Connections are Closed. ======")
-        sys.exit()
-
-        return True
-
-    except Exception as e:
-        print(f"❌ Error in insertion: {e}")
-        return False
-
-
-def pyramid_generation(id, polygon_bool):
+def pyramid_generation(id, polygon_bool, full=False, build_pool=None):
     try:
         yield f"Pyramid generation has started for {id}"
-        # Connect to the PostGIS database move to config on a per layer basis
-        conn = psycopg2.connect(database=db, user=username, password=password, host=host, port=port)
-        cur = conn.cursor()
-
-
-
-        filter_query = ""
-
-        #Create the vedas_vector_tiles table if it does not exist
-        #cur.execute("DROP TABLE IF EXISTS vedas_vector_server_geom_cache")
-        # cur.execute("CREATE TABLE IF NOT EXISTS vedas_vector_server_geom_cache (layer_name VARCHAR,geo_id VARCHAR, geom GEOMETRY,tolerance VARCHAR)")
-        # cur.execute("Create index vedas_vector_server_geom_cache_gist on vedas_vector_server_geom_cache using GIST(geom)")
-        cur = conn.cursor()
-
-
-        #************************Parameter required to change********************************
-        # geoentity_source_id for which pyramid has to be generated.
-        geoentity_source_id = id
-        #if geometry type  is not polygon or multipolygon then False::
-        isPolygon = polygon_bool
-
-
-        delete_query = "DELETE FROM geoentity_pyramid_levels where geoentity_source_id = "+geoentity_source_id
-        cur.execute(delete_query)
-        conn.commit()
-
-        tolerances = ["0.08192","0.04096","0.02048","0.01024","0.00512", "0.00256", "0.00128", "0.00064","0.00032","0.00016","0.00008", "0.00004", "0.00002", "0.00001","original"]
-        tolerances.reverse()
-        prev_tol = ""
-
-
-
-        for level in range(len(tolerances)):
-
-
-            insert_prefix = "INSERT INTO geoentity_pyramid_levels (geoentity_source_id,geoentity_id,level,geom) "
-
-            yield f"Looping {level}"
-            if level == 0:
-                yield f"Enetered if {level}"
-
-                yield f"Ingesting {level} {tolerances[level]}"
-
-                querystr = insert_prefix +" SELECT geoentity_source_id, geoentity_id, "+str(level)+",  geom FROM geoentity where geoentity_source_id="+geoentity_source_id+" " + ("and ST_IsValid(ST_Buffer(geom,0))" if isPolygon else " ")
-                yield f"Query {querystr}"
-
-                cur.execute(querystr)
-                conn.commit()
-            else:
-                yield f"Entered else {level}"
-
-                gridsize = str(0.000001)
-                if(float(tolerances[level])>0.00001):
-                    gridsize = str(0.00001)
-                if(float(tolerances[level])>0.0001):
-                    gridsize = str(0.0001)
-                if(float(tolerances[level])>0.001):
-                    gridsize = str(0.001)
-                yield f"Ingesting {level} {tolerances[level]} {gridsize}"
-
-                querystr = insert_prefix +" SELECT geoentity_source_id, geoentity_id,"+str(level)+", "+ ("ST_MakeValid(ST_Buffer(ST_SnapToGrid(ST_SimplifyPreserveTopology(geom,"+tolerances[level]+"),0,0,"+gridsize+","+gridsize+"),0))" if isPolygon else "geom") +" FROM geoentity_pyramid_levels where geoentity_source_id="+geoentity_source_id+" and level="+str(level-1)+" AND geom IS NOT NULL AND NOT ST_IsEmpty(geom) AND ST_IsValid(geom)"
-                yield f"Query {querystr}"
-
-                cur.execute(querystr)
-                conn.commit()
-
+        # Levels are split into geoentity_id buckets running concurrently on pooled connections,
+        # unless full is asked only geoentities whose geometry changed since the last build are rebuilt
+        for message in pyramid_engine.build_pyramids(build_pool or db_pool, id, polygon_bool, parallelism=PYRAMID_PARALLELISM, mode=PYRAMID_MODE, incremental=not full):
+            yield message
         yield f"Completed"
 
     except Exception as e:
         yield f"Error in pyramid generation: {e}"
 
 
-def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS jobs (
-                job_id TEXT PRIMARY KEY,
-                entity_key TEXT NOT NULL,
-                status TEXT NOT NULL,
-                started_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                message TEXT,
-                result TEXT
-            )
-        ''')
-        conn.commit()
-
-init_db()
-
-def create_job(entity_key):
-    job_id = str(uuid.uuid4())
-    ist = ZoneInfo("Asia/Kolkata")
-    started_on = datetime.now(ist).isoformat()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            INSERT INTO jobs (job_id, entity_key, status, started_on, message)
-            VALUES (?, ?, ?, ?, ?)
-        """, (job_id, entity_key, "pending", started_on, "Job submitted"))
-        conn.commit()
-    return job_id
-
-
-def update_job(job_id, status, message=None, result=None):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            UPDATE jobs SET status=?, message=?, result=?
-            WHERE job_id=?
-        """, (
-            status,
-            message,
-            json.dumps(result) if result else None,
-            job_id
-        ))
-        conn.commit()
-
-
-def get_job_status(job_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute("""
-            SELECT job_id, entity_key, status, started_on, message, result
-            FROM jobs WHERE job_id=?
-        """, (job_id,))
-        row = cursor.fetchone()
-        if row:
-            return {
-                "job_id": row[0],
-                "entity_key": row[1],
-                "status": row[2],
-                "started_on": row[3],
-                "message": row[4],
-                "result": json.loads(row[5]) if row[5] else None
-            }
-        return None
+if __name__ != '__mp_main__':
+    init_resources()
+
+
+_ingestion_executor = None
+_ingestion_executor_lock = threading.Lock()
+
+def run_in_ingestion_pool(job_id, entity_key, entity_config):
+    # Executor is created on first use, a crashed (e.g. OOM killed) pool is replaced for the next job
+    global _ingestion_executor
+    with _ingestion_executor_lock:
+        if _ingestion_executor is None:
+            _ingestion_executor = ingestion_worker.new_executor(INGEST_PROCESSES)
+        executor = _ingestion_executor
+    settings = {
+        "remote": {"host": REMOTE_IP, "username": REMOTE_USER, "password": REMOTE_PASS},
+        "database": {
+            "host": host, "username": username, "password": password, "port": port, "db": db,
+            "geoentity_table": geoentity_table,
+            "geoentity_source_table": geoentity_source_table,
+            "geoentity_source_seq": geoentity_source_seq
+        },
+        "batch_size": INGEST_BATCH_SIZE,
+        "spatial_join_workers": SPATIAL_JOIN_WORKERS,
+        "use_manifest": USE_SOURCE_MANIFEST
+    }
+    try:
+        return executor.submit(ingestion_worker.run_ingestion, job_id, entity_key, entity_config, settings).result()
+    except BrokenProcessPool:
+        with _ingestion_executor_lock:
+            if _ingestion_executor is executor:
+                _ingestion_executor = None
+        raise RuntimeError(f"Ingestion worker process for {entity_key} died unexpectedly")
 
 
 def republish_worker(job_id, entity_key, action):
@@ -542,55 +289,130 @@ def republish_worker(job_id, entity_key, action):
         print(f"[DEBUG] parse_config returned for {entity_key}:")
         print(json.dumps(entity_data, indent=4))
 
-        # Read its GeoJSON file entirely in memory
         geojson_path = entity_data["geoentity_config"]["geoJSON_file_config"]["file_path"]
         print(f"[DEBUG] Remote geojson_path: {geojson_path}")
-        gdf = read_data(geojson_path)  # <- now memory-based
-
-        # Debug print to console
-        print(f"[DEBUG] read_data returned GeoDataFrame with {len(gdf)} rows and {len(gdf.columns)} columns.")
 
         # Update reprocess_flag if republish is pressed and if it is currently False
         print("I am in republish_worker", action)
         # Example update — mark reprocess_flag true in config
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-        sftp = ssh.open_sftp()
+        def mark_for_processing(config_data):
+            if action =="republish":
+                print("I am in Republish's if loop")
+                geoentity_source = config_data["config"][entity_key].get("geoentity_source", {})
+                if "reprocess_flag" in geoentity_source and geoentity_source["reprocess_flag"] is False:
+                    print("Setting reprocess_flag to True", geoentity_source["reprocess_flag"])
+                    geoentity_source["reprocess_flag"] = True
+                    print("Setting reprocess_flag to True", geoentity_source["reprocess_flag"])
+                    config_data["config"][entity_key]["geoentity_source"] = geoentity_source
+
+            if "config" in config_data and entity_key in config_data["config"]:
+                # Replace keys_to_process with only this key
+                config_data["config"]["geoentity_keys_to_process"] = [entity_key]
+
+        # Compare-and-swap write, the job keeps the config it wrote instead of re-reading one another job may have changed
+        config_data = config_cache.update(REMOTE_CONFIG_PATH, mark_for_processing)
+        entity_data_final = config_data["config"][entity_key]
+
+        # Parsing, GeoDataFrame building and EWKB encoding run in a worker process, not under the Flask GIL
+        update_job(job_id, "running", message=f"Ingestion of {entity_key} submitted to worker process")
+        counters = run_in_ingestion_pool(job_id, entity_key, entity_data_final)
+        # a published source shows up in the catalog, revalidate it
+        source_catalog.invalidate()
+        if counters.get("geoentity_source_id") is not None:
+            invalidate_tiles(counters["geoentity_source_id"])
 
-        with sftp.open(REMOTE_CONFIG_PATH, 'r') as remote_file:
-            config_data = json.load(remote_file)
-        if action =="republish":
-            print("I am in Republish's if loop")
-            geoentity_source = config_data["config"][entity_key].get("geoentity_source", {})
-            if "reprocess_flag" in geoentity_source and geoentity_source["reprocess_flag"] is False:
-                print("Setting reprocess_flag to True", geoentity_source["reprocess_flag"])
-                geoentity_source["reprocess_flag"] = True
-                print("Setting reprocess_flag to True", geoentity_source["reprocess_flag"])
-                config_data["config"][entity_key]["geoentity_source"] = geoentity_source
-
-        if "config" in config_data and entity_key in config_data["config"]:
-            # Replace keys_to_process with only this key
-            config_data["config"]["geoentity_keys_to_process"] = [entity_key]
+        update_job(job_id, "completed", message="Job completed", result={
+            "rows_inserted": counters["inserted"],
+            "rows_updated": counters["updated"],
+            "rows_unchanged": counters["unchanged"],
+            "rows_failed": counters["failed"],
+            "rows_skipped": counters["skipped"],
+            "geoentity_source_id": counters["geoentity_source_id"],
+            "resumed_from_feature": counters["resumed_from"],
+            "manifest": counters.get("manifest"),
+            "entity": entity_key
+        })
 
-        with sftp.open(REMOTE_CONFIG_PATH, 'w') as remote_file:
-            remote_file.write(json.dumps(config_data, indent=4))
+    except Exception as e:
+        update_job(job_id, "failed", message=str(e))
 
-        entity_data_final = parse_config(REMOTE_CONFIG_PATH, entity_key)
 
-        insertion_success = insertion(gdf, entity_data_final, entity_key)
+def invalidate_tiles(geoentity_source_id):
+    tile_cache.invalidate(geoentity_source_id)
+    removed = disk_tiles.invalidate(geoentity_source_id)
+    print(f"[Info]:  Invalidated {removed} cached tiles of {geoentity_source_id}\r\n")
 
-        sftp.close()
-        ssh.close()
 
+def pyramid_key(geoentity_source_id):
+    return f"pyramid:{geoentity_source_id}"
 
-        update_job(job_id, "completed", message="Job completed", result={
-            "rows_inserted": len(gdf),
-            "entity": entity_key
-        })
 
-    except Exception as e:
-        update_job(job_id, "failed", message=str(e))
+def pyramid_worker(job_id, geoentity_source_id, is_polygon, full):
+    # Every message is persisted, SSE viewers only tail job_events and never run the build themselves
+    update_job(job_id, "running", message=f"Pyramid generation running for {geoentity_source_id}")
+    failed = None
+    build_pool = pyramid_pool()
+    try:
+        for log in pyramid_generation(geoentity_source_id, is_polygon, full, build_pool):
+            add_job_event(job_id, log)
+            if log.startswith("Error in pyramid generation"):
+                failed = log
+            else:
+                update_job(job_id, "running", message=log)
+        # levels were rewritten (even partially), tiles of the source are rendered again
+        invalidate_tiles(geoentity_source_id)
+        if failed:
+            update_job(job_id, "failed", message=failed)
+            return
+        if TILE_SEED_MAX_ZOOM > 0:
+            try:
+                for log in tile_store.seed_tiles(build_pool, disk_tiles, geoentity_source_id, TILE_SEED_MAX_ZOOM, PYRAMID_PARALLELISM):
+                    add_job_event(job_id, log)
+                    update_job(job_id, "running", message=log)
+            except Exception as e:
+                # the pyramid is built, tiles missing from the seed are rendered on demand
+                traceback.print_exc()
+                add_job_event(job_id, f"Tile seeding failed: {e}")
+    finally:
+        build_pool.closeall()
+    update_job(job_id, "completed", message="Pyramid generated", result={
+        "geoentity_source_id": geoentity_source_id,
+        "mode": PYRAMID_MODE,
+        "incremental": not full
+    })
+
+
+def submit_pyramid_job(geoentity_source_id, is_polygon, full=False, priority=0, job_id=None):
+    params = {"geoentity_source_id": geoentity_source_id, "is_polygon": is_polygon, "full": full}
+    return job_scheduler.submit(pyramid_key(geoentity_source_id), pyramid_worker, args=(geoentity_source_id, is_polygon, full),
+                                action="pyramid", priority=priority, job_id=job_id, params=params)
+
+
+_recovery_lock = threading.Lock()
+_jobs_recovered = False
+
+@app.before_request
+def recover_jobs():
+    # Jobs queued before a restart are queued again, running ones were interrupted.
+    # Done on the first request so the debug reloader's parent process never runs jobs.
+    global _jobs_recovered
+    if _jobs_recovered:
+        return
+    with _recovery_lock:
+        if _jobs_recovered:
+            return
+        _jobs_recovered = True
+        for job in list_jobs("running"):
+            update_job(job["job_id"], "failed", message="Interrupted by application restart")
+        for job in list_jobs("queued"):
+            if job["action"] == "pyramid":
+                if job["params"]:
+                    params = job["params"]
+                    submit_pyramid_job(params["geoentity_source_id"], params["is_polygon"], params["full"], priority=job["priority"] or 0, job_id=job["job_id"])
+                else:
+                    update_job(job["job_id"], "failed", message="Interrupted by application restart")
+                continue
+            job_scheduler.submit(job["entity_key"], republish_worker, args=(job["entity_key"], job["action"] or "publish"), action=job["action"], priority=job["priority"] or 0, job_id=job["job_id"])
 
 
 @app.route('/')
@@ -601,18 +423,7 @@ def index():
 @app.route('/config')
 def config():
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-
-        sftp = ssh.open_sftp()
-
-        with sftp.open(REMOTE_CONFIG_PATH, 'r') as remote_file:
-            config_str = remote_file.read()
-        config_data = json.loads(config_str)
-
-        sftp.close()
-        ssh.close()
+        config_data = config_cache.get(REMOTE_CONFIG_PATH)
 
         config_section = config_data.get("config", {})
         # Filter to only include dict values, skip lists or other types
@@ -628,24 +439,13 @@ def config():
 def register():
     # Connect to remote and load config on both GET and POST
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-        sftp = ssh.open_sftp()
-
-        with sftp.open(REMOTE_CONFIG_PATH, 'r') as remote_config:
-            config_data = json.load(remote_config)
-        sftp.close()
-        ssh.close()
+        config_data = config_cache.get(REMOTE_CONFIG_PATH)
     except Exception as e:
         return f"Error loading config: {e}"
 
     geoentity_sources_sorted = []  # initialize upfront
     try:
-        response = requests.get("https://vedas.sac.gov.in/geoentity-services/api/geoentity-sources/")
-        response.raise_for_status()
-        data = response.json()
-        geoentity_sources_sorted = sorted(data.get("data", []), key=lambda x: x["id"])
+        geoentity_sources_sorted = sorted(source_catalog.sources(), key=lambda x: x["id"])
         print(f"Fetched {len(geoentity_sources_sorted)} geoentity sources")
     except Exception as e:
         geoentity_sources_sorted = []
@@ -666,7 +466,7 @@ def register():
                                         .get("file_path", "")
                     if file_path:
                         print("Reading GeoJSON from:", file_path)
-                        geojson_columns = read_data(file_path, return_columns_only=True)
+                        geojson_columns = read_data(file_path)
                         print(f"Columns found: {geojson_columns}")
 
                 except Exception as e:
@@ -684,6 +484,18 @@ def register():
             return render_template('register.html', parent_geoentity_sources=geoentity_sources_sorted, geojson_columns=[])
 
     elif request.method == 'POST':
+        uploads = []
+
+        # Stream the uploaded geojson straight to the remote Geojson_Files directory while the form is parsed
+        def geojson_upload_stream(filename):
+            if not filename.endswith('.geojson'):
+                return None
+            remote_dir = os.path.dirname(REMOTE_CONFIG_PATH)
+            upload = SFTPUploadStream(sftp_pool, f"{remote_dir.rstrip('/')}/Geojson_Files/{filename}")
+            uploads.append(upload)
+            return upload
+
+        request.upload_stream_factory = geojson_upload_stream
         try:
             # Get submitted key and prepare key_name
             key = request.form.get("key")
@@ -724,50 +536,38 @@ def register():
                 }
             }
 
-            # Connect again for upload and update
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(REMOTE_IP, username=REMOTE_USER, password=REMOTE_PASS)
-            sftp = ssh.open_sftp()
-
-            if geojson_file and filename and filename.endswith('.geojson'):
-                remote_dir = os.path.dirname(REMOTE_CONFIG_PATH)
-                remote_geojson_path = f"{remote_dir.rstrip('/')}/Geojson_Files/{filename}"
-                geojson_file.seek(0)
-                with sftp.open(remote_geojson_path, 'wb') as remote_file:
-                    remote_file.write(geojson_file.read())
-                geoentity_config["geoJSON_file_config"]["file_path"] = remote_geojson_path
+            if geojson_file and filename and isinstance(geojson_file.stream, SFTPUploadStream):
+                report = geojson_file.stream.commit()
+                print("[Info]:  Uploaded " + report["remote_path"] + " (" + str(report["bytes"]) + " bytes in " + str(report["seconds"]) + " s, "
+                      + str(report["mb_per_second"]) + " MB/s, sha256 " + report["sha256"] + ", columns " + str(report["columns"]) + ")\r\n")
+                geoentity_config["geoJSON_file_config"]["file_path"] = report["remote_path"]
             else:
                 # If editing and no new file uploaded, preserve existing file path if present
                 existing = config_data.get("config", {}).get(key_name, {})
                 existing_path = existing.get("geoentity_config", {}).get("geoJSON_file_config", {}).get("file_path", "")
                 geoentity_config["geoJSON_file_config"]["file_path"] = existing_path
 
-            # Load config again (to avoid overwriting changes) — or use loaded config_data from above
-            with sftp.open(REMOTE_CONFIG_PATH, 'r') as remote_config:
-                config_data = json.load(remote_config)
+            # Update the config on its latest version (to avoid overwriting changes)
+            def register_geoentity(config_data):
+                if "config" not in config_data:
+                    config_data["config"] = {}
 
-            if "config" not in config_data:
-                config_data["config"] = {}
+                config_data["config"]["geoentity_keys_to_process"] = [key_name]
 
-            config_data["config"]["geoentity_keys_to_process"] = [key_name]
-
-            # Update the specific geoentity block
-            config_data["config"][key_name] = {
-                "geoentity_source": geoentity_source,
-                "geoentity_config": geoentity_config
-            }
+                # Update the specific geoentity block
+                config_data["config"][key_name] = {
+                    "geoentity_source": geoentity_source,
+                    "geoentity_config": geoentity_config
+                }
 
             # Save updated config.json
-            with sftp.open(REMOTE_CONFIG_PATH, 'w') as remote_config:
-                remote_config.write(json.dumps(config_data, indent=4))
-
-            sftp.close()
-            ssh.close()
+            config_cache.update(REMOTE_CONFIG_PATH, register_geoentity)
 
             return redirect(url_for('config'))
 
         except Exception as e:
+            for upload in uploads:
+                upload.abort()
             return render_template('register.html', message=f'Error: {e}', prefill=request.form)
 
 
@@ -784,31 +584,90 @@ def republish():
         if not is_valid:
             return jsonify({"status": "error", "message": error_message}), 400
 
-        job_id = create_job(entity_key)
+        priority = int(request.form.get("priority", 0))
 
-        # Run in background thread
-        thread = threading.Thread(target=republish_worker, args=(job_id, entity_key, action))
-        thread.start()
+        # Queue on the worker pool, an identical job already waiting is reused
+        job_id, created = job_scheduler.submit(entity_key, republish_worker, args=(entity_key, action), action=action, priority=priority)
 
         return jsonify({
-            "status": "submitted",
+            "status": "queued",
             "job_id": job_id,
             "entity_key": entity_key,
-            "action": action
+            "action": action,
+            "already_queued": not created,
+            "queue_position": job_scheduler.position(job_id)
         }), 202
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/geoentity-sources/', methods=['GET'])
+def geoentity_sources():
+    # Local copy of the geoentity-sources API, same payload, ETag/If-None-Match and gzip
+    try:
+        return cached_json_response(source_catalog.entry())
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 502
+
+
 @app.route('/status/<job_id>', methods=['GET'])
 def check_job_status(job_id):
     job = get_job_status(job_id)
     if job:
+        if job["status"] == "queued":
+            job["queue_position"] = job_scheduler.position(job_id)
         return jsonify(job), 200
     return jsonify({"status": "error", "message": "Job not found"}), 404
 
 
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    return jsonify({"database": db_pool.stats(), "sftp": sftp_pool.stats(), "jobs": job_scheduler.stats(), "tiles": tile_cache.stats(), "tile_store": disk_tiles.stats()}), 200
+
+
+@app.route('/api/geoentities/<int:source_id>', methods=['GET'])
+def geoentity_geometries(source_id):
+    # ?bbox=xmin,ymin,xmax,ymax plus zoom, resolution (degrees per pixel) or level, format=ndjson|geojson, limit
+    output_format = request.args.get("format", "ndjson")
+    try:
+        bbox = geometry_api.parse_bbox(request.args.get("bbox"))
+        level = geometry_api.select_level(request.args.get("zoom"), request.args.get("resolution"), request.args.get("level"))
+        limit = geometry_api.parse_limit(request.args.get("limit"))
+        if output_format not in geometry_api.FORMATS:
+            raise ValueError("format must be one of " + ", ".join(geometry_api.FORMATS))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    mimetype = "application/x-ndjson" if output_format == "ndjson" else "application/geo+json"
+    headers = {"X-Pyramid-Level": str(level), "X-Pyramid-Tolerance": pyramid_engine.TOLERANCES[level]}
+    return Response(stream_with_context(geometry_api.iter_features(db_pool, source_id, bbox, level, output_format, limit)),
+                    mimetype=mimetype, headers=headers)
+
+
+@app.route('/tiles/<int:source_id>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def vector_tile(source_id, z, x, y):
+    if not tile_server.valid_tile(z, x, y):
+        return jsonify({"status": "error", "message": "Tile out of range"}), 404
+    try:
+        data, etag = tile_server.get_tile(db_pool, tile_cache, source_id, z, x, y, disk_tiles)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    headers = {"ETag": '"' + etag + '"', "Cache-Control": "max-age=" + str(TILE_MAX_AGE), "Access-Control-Allow-Origin": "*"}
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if not data:
+        return Response(status=204, headers=headers)
+    if "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+    else:
+        data = gzip.decompress(data)
+    headers["Vary"] = "Accept-Encoding"
+    return Response(data, mimetype="application/vnd.mapbox-vector-tile", headers=headers)
+
+
 @app.route('/generate_pyramids', methods=['POST'])
 def generate_pyramids():
     try:
@@ -817,37 +676,70 @@ def generate_pyramids():
             return jsonify({"status": "error", "message": "No key provided"}), 400
 
         isPolygon = request.form.get("is_polygon") == "True"
+        full = request.form.get("full") == "True"
+        priority = int(request.form.get("priority", 0))
 
-        # Run the function normally without streaming logs
-        # (Can be refactored to call the generator and collect logs if needed)
-        logs = []
-        for log in pyramid_generation(generate_pyramid_key, isPolygon):
-            logs.append(log)
-        # Optionally you can save logs somewhere or print
-        print("".join(logs))
+        # Queued like republish jobs, the build no longer depends on this request or any browser staying connected
+        job_id, created = submit_pyramid_job(generate_pyramid_key, isPolygon, full, priority=priority)
 
         return jsonify({
-            "status": "success",
-            "message": f"Pyramid generated for {generate_pyramid_key}",
-        }), 200
+            "status": "queued",
+            "job_id": job_id,
+            "geoentity_source_id": generate_pyramid_key,
+            "already_queued": not created,
+            "queue_position": job_scheduler.position(job_id),
+            "message": f"Pyramid generation queued for {generate_pyramid_key}"
+        }), 202
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+SSE_POLL_INTERVAL = 1
+SSE_HEARTBEAT_INTERVAL = 15
+
 @app.route('/generate_pyramids_sse_stream', methods=['GET'])
 def generate_pyramids_sse_stream():
-    geoentity_source_id = request.args.get("geoentity_source_id")
-    if not geoentity_source_id:
-        return jsonify({"status": "error", "message": "No key provided"}), 400
+    job_id = request.args.get("job_id")
+    if not job_id:
+        # Viewers knowing only the source watch its latest pyramid job
+        geoentity_source_id = request.args.get("geoentity_source_id")
+        if not geoentity_source_id:
+            return jsonify({"status": "error", "message": "No key provided"}), 400
+        job = latest_job(pyramid_key(geoentity_source_id), action="pyramid")
+        if not job:
+            return jsonify({"status": "error", "message": "No pyramid job found"}), 404
+        job_id = job["job_id"]
+    elif not get_job_status(job_id):
+        return jsonify({"status": "error", "message": "Job not found"}), 404
 
-    isPolygon = request.args.get("is_polygon") == "True"
+    # Reconnecting EventSource sends the last seen id, the stream resumes after it
+    last_seq = int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
 
     def generate():
-        # Yield SSE formatted messages
-        for log in pyramid_generation(geoentity_source_id, isPolygon):
-            # SSE event format: data: <message>\n\n
-            yield f"data: {log.strip()}\n\n"
+        # Yield SSE formatted messages tailed from the stored job events
+        seq = last_seq
+        last_sent = time.time()
+        while True:
+            events = get_job_events(job_id, seq)
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {seq}\ndata: {event['message'].strip()}\n\n"
+                last_sent = time.time()
+            if not events:
+                job = get_job_status(job_id)
+                if job is None or job["status"] in ("completed", "failed"):
+                    # the last events may have been stored between the two reads
+                    for event in get_job_events(job_id, seq):
+                        seq = event["seq"]
+                        yield f"id: {seq}\ndata: {event['message'].strip()}\n\n"
+                    status = job["status"] if job else "failed"
+                    yield f"event: end\ndata: {status}\n\n"
+                    return
+                if time.time() - last_sent >= SSE_HEARTBEAT_INTERVAL:
+                    yield ": heartbeat\n\n"
+                    last_sent = time.time()
+                time.sleep(SSE_POLL_INTERVAL)
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
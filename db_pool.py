@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "PostgreSQL Connection Pool"
+__purpose__= "Bounded, health checked psycopg2 connection pool shared by Flask routes and background jobs."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+
+
+class PooledDB:
+    """
+    psycopg2 ThreadedConnectionPool which blocks (up to acquire_timeout) instead
+    of raising when all maxconn connections are borrowed, checks connections
+    before handing them out and keeps wait metrics.
+
+    Every connection gets statement_timeout_ms as its session statement_timeout,
+    long running jobs override it per borrow (statement_timeout=0 is no limit).
+    """
+
+    def __init__(self, database, user, password, host, port, minconn=0, maxconn=10, statement_timeout_ms=60000, acquire_timeout=60, health_check_after=30, **connect_kwargs):
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn,
+            database=database, user=user, password=password, host=host, port=port,
+            options="-c statement_timeout=" + str(int(statement_timeout_ms)),
+            **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._metrics = {"checkouts": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0, "replaced": 0, "in_use": 0}
+
+    #------------------------------------#
+    # Connection Handling                #
+    #------------------------------------#
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.time() - self._last_used.get(id(conn), 0) < self.health_check_after:
+            return True
+        try:
+            previous_autocommit = conn.autocommit
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = previous_autocommit
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, autocommit=False, statement_timeout=None):
+        """
+        Borrow a connection, waits while the pool is exhausted.
+        statement_timeout (ms) overrides the pool default for this borrow only.
+        """
+        start = time.time()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics["waits"] += 1
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._metrics["timeouts"] += 1
+                raise psycopg2.pool.PoolError("No database connection available within " + str(self.acquire_timeout) + " seconds")
+        waited = time.time() - start
+
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+                with self._lock:
+                    self._metrics["replaced"] += 1
+            conn.autocommit = autocommit
+            if statement_timeout is not None:
+                with conn.cursor() as cur:
+                    cur.execute("SET statement_timeout = %s", (int(statement_timeout),))
+                if not autocommit:
+                    conn.commit()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            self._metrics["in_use"] += 1
+            self._metrics["wait_seconds"] += waited
+            self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], waited)
+        return conn
+
+    def putconn(self, conn):
+        close = conn.closed
+        if not close:
+            try:
+                if not conn.autocommit:
+                    conn.rollback()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("RESET statement_timeout")
+                self._last_used[id(conn)] = time.time()
+            except psycopg2.Error:
+                close = True
+        if close:
+            self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=close)
+        self._slots.release()
+        with self._lock:
+            self._metrics["in_use"] -= 1
+
+    @contextmanager
+    def connection(self, autocommit=False, statement_timeout=None):
+        """
+        with db_pool.connection() as conn: ... commits on success, rolls back on error.
+        """
+        conn = self.getconn(autocommit, statement_timeout)
+        try:
+            yield conn
+            if not conn.autocommit and not conn.closed:
+                conn.commit()
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["maxconn"] = self.maxconn
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["waits"] if stats["waits"] else 0.0
+        return stats
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+def pool_from_env(**overrides):
+    """
+    PooledDB configured from the same .env variables as the app
+    (HOST, SERVER_USERNAME, PASSWORD, PORT, DB) plus DB_POOL_MIN, DB_POOL_MAX
+    and DB_STATEMENT_TIMEOUT_MS.
+    """
+    settings = {
+        "database": os.getenv("DB"),
+        "user": os.getenv("SERVER_USERNAME"),
+        "password": os.getenv("PASSWORD"),
+        "host": os.getenv("HOST"),
+        "port": os.getenv("PORT"),
+        "minconn": int(os.getenv("DB_POOL_MIN", 0)),
+        "maxconn": int(os.getenv("DB_POOL_MAX", 10)),
+        "statement_timeout_ms": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 60000)),
+    }
+    settings.update(overrides)
+    return PooledDB(**settings)
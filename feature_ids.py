@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Feature ID Digests"
+__purpose__= "Compact duplicate detection of feature ids: 64 bit blake2b digests in a numpy open addressing table."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import hashlib
+
+import numpy as np
+
+
+def feature_id_digest(value):
+    """
+    64 bit digest of a feature id. Integral floats are taken as integers (1 and 1.0 are
+    the same id, as in pandas duplicated), strings and numbers stay distinct ("1" is not 1).
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DigestSet:
+    """
+    Set of 64 bit digests kept in a uint64 array with linear probing, 8 to 16 bytes
+    per entry instead of a Python int object and a set slot. 0 marks an empty slot.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self._slots = np.zeros(capacity, dtype=np.uint64)
+        self._mask = capacity - 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _insert(self, slots, mask, digest):
+        index = digest & mask
+        while True:
+            current = int(slots[index])
+            if current == 0:
+                slots[index] = digest
+                return True
+            if current == digest:
+                return False
+            index = (index + 1) & mask
+
+    def _grow(self):
+        old_slots = self._slots
+        self._slots = np.zeros(len(old_slots) * 2, dtype=np.uint64)
+        self._mask = len(self._slots) - 1
+        for digest in old_slots[old_slots != 0].tolist():
+            self._insert(self._slots, self._mask, digest)
+
+    def add(self, digest):
+        """
+        Adds digest, returns False when it was already present.
+        """
+        digest = digest or 1
+        if (self._size + 1) * 2 > len(self._slots):
+            self._grow()
+        added = self._insert(self._slots, self._mask, digest)
+        if added:
+            self._size = self._size + 1
+        return added
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Bulk Loader"
+__purpose__= "Phase-2 geoentity insertion through a COPY staging table instead of one INSERT per feature."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import csv
+import io
+import json
+import math
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.errors
+import shapely
+
+
+DEFAULT_BATCH_SIZE = 10000
+STAGING_TABLE = "geoentity_staging"
+REPROCESS_MODES = ("skip", "update")
+
+
+#------------------------------------#
+# Row Preparation                    #
+#------------------------------------#
+def get_aux_data(attributes_array, row):
+    returnobj={'features':{}}
+    for att in attributes_array:
+        if 'Level_IV' in att:
+            returnobj['features']['Level_lV']=str(row[att])
+        else:
+            returnobj['features'][att]=str(row[att])
+
+    return json.dumps(returnobj)
+
+
+def get_geoentity_id(geoentity_id_key, row, type):
+    if type=="Int":
+        return str(int(row[geoentity_id_key]))
+    else:
+        return str(row[geoentity_id_key])
+
+
+def frame_columns(geojson_file_config):
+    # Properties read by prepare_row / prepare_frame
+    info_attribute = geojson_file_config["geoJSON_info_attribute"]
+    return [info_attribute["name"], info_attribute["feature_ID"]] + list(geojson_file_config.get("geoJSON_aux_attributes", []))
+
+
+def valid_name(name):
+    # NaN, None and empty names are skipped
+    return bool(name and (not isinstance(name, float) or not math.isnan(name)))
+
+
+def get_ewkb(geom, srid=4326):
+    """
+    Purpose
+    ----------
+    Hex encoded EWKB of a shapely geometry, accepted as-is by the text input of a PostGIS geometry column.
+
+    Parameters
+    ----------
+    geom : shapely geometry
+    srid : SRID embedded in the EWKB header
+
+    Returns
+    -------
+    EWKB hex string or None for empty/missing geometry
+    """
+    if geom is None or geom.is_empty:
+        return None
+    return shapely.to_wkb(shapely.set_srid(geom, srid), hex=True, include_srid=True)
+
+
+def prepare_row(row, geojson_file_config):
+    """
+    Purpose
+    ----------
+    Builds the (geoentity_id, name, geom, auxdata) record of one GeoDataFrame row, same values as the old per-row INSERT.
+
+    Parameters
+    ----------
+    row : GeoDataFrame row
+    geojson_file_config : "geoJSON_file_config" block of the geoentity config
+
+    Returns
+    -------
+    Tuple of column values or None if the row has to be skipped (empty name).
+    """
+    info_attribute = geojson_file_config["geoJSON_info_attribute"]
+    feature_id_type = info_attribute.get("feature_ID_type", "str")
+
+    geoentity_name = row[info_attribute["name"]]
+    if not valid_name(geoentity_name):
+        return None
+    geoentity_name = geoentity_name.replace("'", "")
+
+    geoentity_id = geojson_file_config["prefix_identifier"] + get_geoentity_id(info_attribute["feature_ID"], row, feature_id_type)
+
+    auxdata = None
+    if "geoJSON_aux_attributes" in geojson_file_config:
+        auxdata = get_aux_data(geojson_file_config["geoJSON_aux_attributes"], row)
+
+    return (geoentity_id, geoentity_name, get_ewkb(row.geometry), auxdata)
+
+
+def _aux_data_column(frame, attributes_array):
+    # Same key handling and json.dumps layout as get_aux_data, assembled column-wise
+    aux_columns = {}
+    for att in attributes_array:
+        key = 'Level_lV' if 'Level_IV' in att else att
+        # str() per value as in get_aux_data, astype(str) may keep missing values as NaN
+        aux_columns[key] = frame[att].map(str)
+    if not aux_columns:
+        return pd.Series(json.dumps({'features': {}}), index=frame.index)
+    auxdata = None
+    for key, column in aux_columns.items():
+        part = json.dumps(key) + ": " + column.map(json.dumps)
+        auxdata = part if auxdata is None else auxdata + ", " + part
+    return '{"features": {' + auxdata + '}}'
+
+
+def prepare_frame(gdf, geojson_file_config, parent_index=None):
+    """
+    Purpose
+    ----------
+    Vectorized counterpart of prepare_row, computes the record columns for a whole GeoDataFrame slice.
+
+    Parameters
+    ----------
+    gdf : GeoDataFrame (slice)
+    geojson_file_config : "geoJSON_file_config" block of the geoentity config
+    parent_index : optional parent_lookup.ParentIndex, records then also carry parent_id and parent_name
+
+    Returns
+    -------
+    (records, skipped) where records is a list of (geoentity_id, name, geom, auxdata) tuples
+    """
+    info_attribute = geojson_file_config["geoJSON_info_attribute"]
+    feature_id_type = info_attribute.get("feature_ID_type", "str")
+
+    valid = gdf[info_attribute["name"]].map(valid_name).astype(bool)
+    frame = gdf[valid]
+    skipped = len(gdf) - len(frame)
+    if frame.empty:
+        return [], skipped
+
+    # str.replace itself, a non-str name fails as in prepare_row instead of becoming NaN
+    names = frame[info_attribute["name"]].map(lambda name: name.replace("'", ""))
+
+    feature_ids = frame[info_attribute["feature_ID"]]
+    if feature_id_type == "Int":
+        feature_ids = feature_ids.astype(np.int64)
+    geoentity_ids = geojson_file_config["prefix_identifier"] + feature_ids.map(str)
+
+    geoms = shapely.set_srid(np.asarray(frame.geometry.values, dtype=object), 4326)
+    ewkb = shapely.to_wkb(geoms, hex=True, include_srid=True)
+    ewkb[shapely.is_missing(geoms) | shapely.is_empty(geoms)] = None
+
+    if "geoJSON_aux_attributes" in geojson_file_config:
+        auxdata = _aux_data_column(frame, geojson_file_config["geoJSON_aux_attributes"]).tolist()
+    else:
+        auxdata = [None] * len(frame)
+
+    records = list(zip(geoentity_ids.tolist(), names.tolist(), ewkb.tolist(), auxdata))
+    if parent_index is not None:
+        records = parent_index.assign(records, geoms)
+    return records, skipped
+
+
+def prepare_batches(gdf, geojson_file_config, batch_size=DEFAULT_BATCH_SIZE, vectorized=True, parent_index=None):
+    """
+    Yields (records, skipped) for every batch_size features of gdf.
+    vectorized=False keeps the row by row preparation (prepare_row) so both outputs can be diffed.
+    """
+    if vectorized:
+        for start in range(0, len(gdf), batch_size):
+            yield prepare_frame(gdf.iloc[start:start + batch_size], geojson_file_config, parent_index)
+        return
+
+    records = []
+    geoms = []
+    skipped = 0
+    for i, row in gdf.iterrows():
+        record = prepare_row(row, geojson_file_config)
+        if record is None:
+            skipped = skipped + 1
+            continue
+        records.append(record)
+        geoms.append(row.geometry)
+        if len(records) >= batch_size:
+            yield (records if parent_index is None else parent_index.assign(records, geoms)), skipped
+            records = []
+            geoms = []
+            skipped = 0
+    if records or skipped:
+        yield (records if parent_index is None else parent_index.assign(records, geoms)), skipped
+
+
+#------------------------------------#
+# Database Loading                   #
+#------------------------------------#
+def create_staging_table(cur, geoentity_table="geoentity"):
+    """
+    Session temp table with the same column types as the geoentity table so
+    that the INSERT ... SELECT does not need any casts (auxdata json, typed geom).
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS " + STAGING_TABLE + " AS SELECT geoentity_id, name, geom, auxdata, parent_id, parent_name FROM " + geoentity_table + " WITH NO DATA")
+    cur.execute("TRUNCATE " + STAGING_TABLE)
+
+
+def _target_columns(parent_source_id, has_aux, has_parent=False):
+    columns = ["geoentity_source_id", "geoentity_id", "name", "geom"]
+    if parent_source_id > 0:
+        columns.append("parent_geoentity_source_id")
+    if has_aux:
+        columns.append("auxdata")
+    if has_parent:
+        columns.extend(["parent_id", "parent_name"])
+    return columns
+
+
+def _copy_records(cur, records):
+    columns = "geoentity_id, name, geom, auxdata"
+    if records and len(records[0]) == 6:
+        columns = columns + ", parent_id, parent_name"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(records)
+    buffer.seek(0)
+    cur.copy_expert("COPY " + STAGING_TABLE + " (" + columns + ") FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _conflict_clause(columns, reprocess_flag, reprocess_mode, compare_hash):
+    """
+    ON CONFLICT ... RETURNING suffix of the geoentity INSERT.
+    RETURNING (xmax = 0) is true for inserted and false for updated rows,
+    rows left untouched by the conflict handling are not returned at all.
+    Conflicts are found on the file geoentity_id: rows of a child layer must have had their
+    parent prefix removed first (spatial_join.reset_parent_join), as ingest_geoentity does.
+    """
+    if not reprocess_flag:
+        return ""
+    if reprocess_mode == "update":
+        updated_columns = [column for column in columns if column not in ("geoentity_source_id", "geoentity_id")]
+        clause = " ON CONFLICT (geoentity_source_id, geoentity_id) DO UPDATE SET " + ", ".join(column + " = EXCLUDED." + column for column in updated_columns)
+        if compare_hash:
+            changed = ["md5(ST_AsEWKB(t.geom)) IS DISTINCT FROM md5(ST_AsEWKB(EXCLUDED.geom))"]
+            # json has no equality operator, compared as text
+            changed.extend("t." + column + ("::text" if column == "auxdata" else "") + " IS DISTINCT FROM EXCLUDED." + column + ("::text" if column == "auxdata" else "")
+                           for column in updated_columns if column != "geom")
+            clause = clause + " WHERE " + " OR ".join(changed)
+        return clause + " RETURNING (xmax = 0)"
+    return " ON CONFLICT DO NOTHING RETURNING (xmax = 0)"
+
+
+def _count_returned(cur, total):
+    rows = cur.fetchall()
+    inserted = sum(1 for row in rows if row[0])
+    return {"inserted": inserted, "updated": len(rows) - inserted, "unchanged": total - len(rows)}
+
+
+def _insert_row_by_row(cur, records, geoentity_table, geoentity_source_id, parent_source_id, has_aux, reprocess_flag, reprocess_mode="skip", compare_hash=True):
+    # Fallback for a batch which failed as a whole, keeps per-row failure accounting
+    has_parent = bool(records) and len(records[0]) == 6
+    columns = _target_columns(parent_source_id, has_aux, has_parent)
+    query = "INSERT INTO " + geoentity_table + " AS t (" + ", ".join(columns) + ") VALUES (" + ", ".join(["%s"] * len(columns)) + ")" + _conflict_clause(columns, reprocess_flag, reprocess_mode, compare_hash)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    for record in records:
+        values = [geoentity_source_id, record[0], record[1], record[2]]
+        if parent_source_id > 0:
+            values.append(parent_source_id)
+        if has_aux:
+            values.append(record[3])
+        if has_parent:
+            values.extend(record[4:6])
+        try:
+            cur.execute(query, values)
+            if reprocess_flag:
+                for key, value in _count_returned(cur, 1).items():
+                    counts[key] = counts[key] + value
+            elif cur.rowcount == 1:
+                counts["inserted"] = counts["inserted"] + 1
+            else:
+                counts["failed"] = counts["failed"] + 1
+        except psycopg2.errors.UniqueViolation:
+            raise
+        except psycopg2.Error as e:
+            print("<Error> " + str(e.pgerror) + "\r\n")
+            counts["failed"] = counts["failed"] + 1
+    return counts
+
+
+def load_batch(cur, records, geoentity_table, geoentity_source_id, parent_source_id, has_aux, reprocess_flag, reprocess_mode="skip", compare_hash=True):
+    """
+    Purpose
+    ----------
+    COPY one batch into the staging table and move it into the geoentity table with a single INSERT ... SELECT.
+
+    Parameters
+    ----------
+    cur : cursor of an autocommit connection on which create_staging_table was called
+    records : list of (geoentity_id, name, geom ewkb hex, auxdata[, parent_id, parent_name])
+    geoentity_table : target table
+    geoentity_source_id : id returned by Phase-1
+    parent_source_id : parent_geoentity_source_id of the config
+    has_aux : whether auxdata has to be written
+    reprocess_flag : already existing rows are handled by ON CONFLICT instead of aborting
+    reprocess_mode : "skip" leaves existing rows as they are, "update" overwrites them with the file values
+    compare_hash : with "update", only rows whose geometry hash, name or attributes differ are rewritten
+
+    Returns
+    -------
+    Dict with inserted, updated, unchanged and failed record counts of the batch
+    """
+    records_with_geom = [record for record in records if record[2] is not None]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": len(records) - len(records_with_geom)}
+    if not records_with_geom:
+        return counts
+
+    has_parent = len(records_with_geom[0]) == 6
+    columns = _target_columns(parent_source_id, has_aux, has_parent)
+    select_columns = [str(int(geoentity_source_id)), "geoentity_id", "name", "geom"]
+    if parent_source_id > 0:
+        select_columns.append(str(int(parent_source_id)))
+    if has_aux:
+        select_columns.append("auxdata")
+    if has_parent:
+        select_columns.extend(["parent_id", "parent_name"])
+    # DO UPDATE cannot touch the same row twice in one statement, duplicated ids of a batch are loaded once
+    distinct = "DISTINCT ON (geoentity_id) " if reprocess_flag and reprocess_mode == "update" else ""
+    query = "INSERT INTO " + geoentity_table + " AS t (" + ", ".join(columns) + ") SELECT " + distinct + ", ".join(select_columns) + " FROM " + STAGING_TABLE + _conflict_clause(columns, reprocess_flag, reprocess_mode, compare_hash)
+
+    try:
+        _copy_records(cur, records_with_geom)
+        cur.execute(query)
+        if reprocess_flag:
+            counts.update(_count_returned(cur, len(records_with_geom)))
+        else:
+            counts["inserted"] = cur.rowcount
+            counts["failed"] = counts["failed"] + len(records_with_geom) - cur.rowcount
+    except psycopg2.errors.UniqueViolation:
+        raise
+    except psycopg2.Error as e:
+        print("<Error> Batch load failed, retrying row by row: " + str(e.pgerror) + "\r\n")
+        row_counts = _insert_row_by_row(cur, records_with_geom, geoentity_table, geoentity_source_id, parent_source_id, has_aux, reprocess_flag, reprocess_mode, compare_hash)
+        row_counts["failed"] = row_counts["failed"] + counts["failed"]
+        counts = row_counts
+    finally:
+        cur.execute("TRUNCATE " + STAGING_TABLE)
+    return counts
+
+
+def bulk_insert(cur, frames, geoentity_source_id, parent_source_id, geojson_file_config, reprocess_flag, geoentity_table="geoentity", batch_size=DEFAULT_BATCH_SIZE, vectorized=True, progress=None, parent_index=None, start_offset=0, checkpoint=None, counters=None, reprocess_mode="skip", compare_hash=True):
+    """
+    Purpose
+    ----------
+    Phase-2 insertion of all the features of frames through COPY batches.
+
+    Parameters
+    ----------
+    cur : cursor of an autocommit connection
+    frames : GeoDataFrame of the geojson file or an iterable of GeoDataFrame chunks (streamed reading)
+    geoentity_source_id : id returned by Phase-1
+    parent_source_id : resolved parent_geoentity_source_id (-1 already replaced by the previous source id)
+    geojson_file_config : "geoJSON_file_config" block of the geoentity config
+    reprocess_flag : "reprocess_flag" of the geoentity source
+    geoentity_table : target table
+    batch_size : features per COPY batch
+    vectorized : column-wise record preparation, False falls back to the row by row path
+    progress : optional callable receiving a copy of the counters after every batch
+    parent_index : optional parent_lookup.ParentIndex, parents are then written with the rows (no Phase-3 update for them)
+    start_offset : feature offset of the first feature of frames (resumed load, earlier features are already committed)
+    checkpoint : optional callable(feature_offset, counters) once a batch is committed, feature_offset is where to resume
+    counters : counters of the interrupted load when resuming, totals then cover the whole file
+    reprocess_mode : "skip" (ON CONFLICT DO NOTHING) or "update" (ON CONFLICT DO UPDATE), used with reprocess_flag
+    compare_hash : with "update", unchanged rows (geometry hash, name, attributes) are not rewritten
+
+    Returns
+    -------
+    Dict with processed (inserted + updated + unchanged), inserted, updated, unchanged, failed and
+    skipped record counts (and parent_matched with parent_index).
+    Raises psycopg2.errors.UniqueViolation on duplicates when reprocess_flag is false.
+    """
+    if reprocess_mode not in REPROCESS_MODES:
+        raise ValueError("Unknown reprocess_mode " + str(reprocess_mode) + ", expected one of " + ", ".join(REPROCESS_MODES))
+    has_aux = "geoJSON_aux_attributes" in geojson_file_config
+    counters = dict(counters or {"processed": 0, "failed": 0, "skipped": 0})
+    for key in ("inserted", "updated", "unchanged"):
+        counters.setdefault(key, 0)
+    if parent_index is not None:
+        counters.setdefault("parent_matched", 0)
+    feature_offset = start_offset
+
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+
+    create_staging_table(cur, geoentity_table)
+    for gdf in frames:
+        for records, skipped in prepare_batches(gdf, geojson_file_config, batch_size, vectorized, parent_index):
+            batch_counts = load_batch(cur, records, geoentity_table, geoentity_source_id, parent_source_id, has_aux, reprocess_flag, reprocess_mode, compare_hash)
+            if parent_index is not None:
+                counters["parent_matched"] = counters["parent_matched"] + sum(1 for record in records if record[4] is not None and record[2] is not None)
+            for key in ("inserted", "updated", "unchanged", "failed"):
+                counters[key] = counters[key] + batch_counts[key]
+            counters["processed"] = counters["processed"] + batch_counts["inserted"] + batch_counts["updated"] + batch_counts["unchanged"]
+            counters["skipped"] = counters["skipped"] + skipped
+            # every feature of the batch is either in records or skipped
+            feature_offset = feature_offset + len(records) + skipped
+            if checkpoint:
+                checkpoint(feature_offset, dict(counters))
+            print("[Info]:  Phase2 batch loaded, processed records so far:" + str(counters["processed"]) + "\r\n")
+            if progress:
+                progress(dict(counters))
+    return counters
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoJSON Stream Reader"
+__purpose__= "Chunked GeoJSON feature reading with ijson from any file object (SFTP handle or local file)."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import geopandas as gpd
+import ijson
+
+
+READ_BUFSIZE = 1024 * 1024
+
+
+def iter_features(file_obj, buf_size=READ_BUFSIZE):
+    # use_float keeps numbers as float/int like json.loads instead of Decimal
+    return ijson.items(file_obj, 'features.item', use_float=True, buf_size=buf_size)
+
+
+def _chunk_frame(features, columns):
+    frame = gpd.GeoDataFrame.from_features(features)
+    # a property absent from every feature of the chunk is a NaN column, as in a whole file GeoDataFrame
+    for column in columns:
+        if column not in frame.columns:
+            frame[column] = float("nan")
+    return frame
+
+
+def iter_feature_chunks(file_obj, chunk_size, buf_size=READ_BUFSIZE, skip=0, feature_filter=None, columns=()):
+    """
+    Yields GeoDataFrames of at most chunk_size features, so only one chunk
+    is held in memory at a time whatever the size of the file.
+    feature_filter(feature) returning False drops a feature (diff ingestion),
+    then the first skip remaining features are dropped as well (resumed loads).
+    Every chunk has the given columns, even when none of its features carries them.
+    """
+    features = []
+    index = 0
+    for feature in iter_features(file_obj, buf_size):
+        if feature_filter is not None and not feature_filter(feature):
+            continue
+        index = index + 1
+        if index <= skip:
+            continue
+        features.append(feature)
+        if len(features) >= chunk_size:
+            yield _chunk_frame(features, columns)
+            features = []
+    if features:
+        yield _chunk_frame(features, columns)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Geometry API"
+__purpose__= "Bbox geometry fetch from the coarsest pyramid level fitting the requested resolution, streamed as GeoJSON features."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import json
+import math
+
+import pyramid_engine
+
+
+FORMATS = ("ndjson", "geojson")
+FETCH_SIZE = 2000
+
+
+def parse_bbox(text):
+    """
+    "xmin,ymin,xmax,ymax" in degrees to a tuple of floats, raises ValueError when malformed.
+    """
+    values = [float(value) for value in (text or "").split(",")]
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise ValueError("bbox must be xmin,ymin,xmax,ymax")
+    return tuple(values)
+
+
+def parse_limit(text):
+    """
+    Optional feature limit to a positive int (None without limit), raises ValueError otherwise.
+    """
+    if text is None or text == "":
+        return None
+    limit = int(text)
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    return limit
+
+
+def select_level(zoom=None, resolution=None, level=None):
+    """
+    Pyramid level for an explicit level, a target resolution (degrees per pixel) or a web map zoom, in that order.
+    """
+    if level is not None:
+        level = int(level)
+        if not 0 <= level < len(pyramid_engine.TOLERANCES):
+            raise ValueError("level must be between 0 and " + str(len(pyramid_engine.TOLERANCES) - 1))
+        return level
+    if resolution is not None:
+        return pyramid_engine.level_for_resolution(float(resolution))
+    if zoom is not None:
+        return pyramid_engine.level_for_zoom(float(zoom))
+    raise ValueError("one of zoom, resolution or level is required")
+
+
+def coordinate_precision(level):
+    # Decimals below the level tolerance carry nothing, the original geometry keeps 7 (about 1 cm)
+    if level == 0:
+        return 7
+    return min(7, int(math.ceil(-math.log10(float(pyramid_engine.TOLERANCES[level])))) + 1)
+
+
+def feature_query(level, limit=None):
+    return ("SELECT p.geoentity_id, g.name, ST_AsGeoJSON(p.geom, " + str(coordinate_precision(level)) + ")"
+            + " FROM " + pyramid_engine.PYRAMID_TABLE + " p"
+            + " LEFT JOIN geoentity g ON g.geoentity_source_id = p.geoentity_source_id AND g.geoentity_id = p.geoentity_id"
+            + " WHERE p.geoentity_source_id = %(source_id)s AND p.level = %(level)s"
+            + " AND p.geom && ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 4326)"
+            + (" LIMIT " + str(int(limit)) if limit else ""))
+
+
+def _feature(geoentity_id, name, geometry, level):
+    # geometry is already GeoJSON text from PostGIS, embedded as is
+    return ('{"type":"Feature","id":' + json.dumps(geoentity_id) + ',"properties":'
+            + json.dumps({"geoentity_id": geoentity_id, "name": name, "level": level}) + ',"geometry":' + geometry + '}')
+
+
+def iter_features(db_pool, geoentity_source_id, bbox, level, output_format="ndjson", limit=None):
+    """
+    Purpose
+    ----------
+    Streams the features of one pyramid level intersecting bbox, read through a server side
+    cursor so neither the database driver nor the app holds the whole result.
+
+    Parameters
+    ----------
+    db_pool : db_pool.PooledDB
+    geoentity_source_id : source to read
+    bbox : (xmin, ymin, xmax, ymax) in EPSG:4326
+    level : pyramid level, see select_level
+    output_format : "ndjson" (one feature per line) or "geojson" (FeatureCollection)
+    limit : maximum number of features
+
+    Returns
+    -------
+    Generator of text chunks.
+    """
+    if output_format not in FORMATS:
+        raise ValueError("Unknown format " + str(output_format) + ", expected one of " + ", ".join(FORMATS))
+    params = {"source_id": int(geoentity_source_id), "level": int(level),
+              "xmin": bbox[0], "ymin": bbox[1], "xmax": bbox[2], "ymax": bbox[3]}
+    if output_format == "geojson":
+        yield '{"type":"FeatureCollection","features":['
+    separator = "\n" if output_format == "ndjson" else ","
+    first = True
+    with db_pool.connection() as conn:
+        with conn.cursor(name="geoentity_geometry_fetch") as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(feature_query(level, limit), params)
+            for geoentity_id, name, geometry in cur:
+                if geometry is None:
+                    continue
+                feature = _feature(geoentity_id, name, geometry, int(level))
+                if output_format == "ndjson":
+                    yield feature + separator
+                else:
+                    yield (feature if first else separator + feature)
+                first = False
+    if output_format == "geojson":
+        yield ']}'
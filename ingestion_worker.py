@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Ingestion Worker"
+__purpose__= "Runs GeoEntityIngest for one geoentity key inside a spawned worker process."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+# Kept free of Flask/app imports. Under python app.py the spawned processes still re-import app.py
+# as __mp_main__ (its imports only, app.init_resources is skipped there), under a WSGI server they do not.
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+
+import geoentity_bulk_loader
+import job_store
+import source_manifest
+from GeoEntityIngestion import GeoEntityIngest
+from geojson_stream import iter_feature_chunks, READ_BUFSIZE
+from sftp_pool import SFTPPool
+
+
+PROGRESS_INTERVAL = 5  # seconds between progress writes to the jobs table
+
+
+def new_executor(max_workers):
+    # spawn: no fork of the Flask process with its threads, sockets and pools
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def file_signature(geojson_path, attributes):
+    # A checkpoint is only valid for the very file it was taken on
+    return geojson_path + ":" + str(attributes.st_size) + ":" + str(attributes.st_mtime)
+
+
+def unchanged_counters(manifest, reason):
+    return {"processed": 0, "inserted": 0, "updated": 0, "unchanged": manifest["feature_count"], "failed": 0, "skipped": 0,
+            "geoentity_source_id": manifest["geoentity_source_id"], "resumed_from": 0, "manifest": reason}
+
+
+def resume_point(entity_key, signature, config_hash):
+    checkpoint = job_store.get_checkpoint(entity_key)
+    if checkpoint is None:
+        return None
+    if checkpoint["file_signature"] != signature:
+        print("[Info]:  Checkpoint of " + entity_key + " discarded, the geojson file changed since\r\n")
+        job_store.clear_checkpoint(entity_key)
+        return None
+    if checkpoint["config_hash"] != config_hash:
+        # source id, prefix and parent of the checkpointed rows may no longer match the config
+        print("[Info]:  Checkpoint of " + entity_key + " discarded, the entity config changed since\r\n")
+        job_store.clear_checkpoint(entity_key)
+        return None
+    return checkpoint
+
+
+def run_ingestion(job_id, entity_key, entity_config, settings):
+    """
+    Purpose
+    ----------
+    Process pool entry point, streams the remote geojson of entity_key and ingests it with GeoEntityIngest.
+
+    Parameters
+    ----------
+    job_id : jobs table id used for progress reporting
+    entity_key : geoentity key of the config
+    entity_config : config["config"][entity_key] block
+    settings : {"remote": {host, username, password}, "database": global_param.database block, "batch_size": int,
+                "spatial_join_workers": int, "use_manifest": bool}
+
+    Returns
+    -------
+    Phase-2 counters dict with geoentity_source_id and manifest ("full", "diff", "unchanged" or "same content")
+
+    With a manifest of the previous ingestion (same file path and config), an untouched file
+    (size, mtime) is not read at all, otherwise the file is read once: unchanged features are
+    filtered out, the rows of changed ones are deleted chunk by chunk right before their new
+    version is loaded and the rows of removed ones once the whole file went through.
+    """
+    last_report = [0.0, None]
+
+    def progress(phase, counters):
+        now = time.time()
+        # first event of a phase always goes through, then at most one every PROGRESS_INTERVAL
+        if phase == last_report[1] and now - last_report[0] < PROGRESS_INTERVAL:
+            return
+        last_report[0] = now
+        last_report[1] = phase
+        message = phase + " running for " + entity_key
+        if counters:
+            message = message + ", processed " + str(counters["processed"]) + ", failed " + str(counters["failed"])
+            if "join_batches" in counters:
+                message = message + ", join batches " + str(counters["join_batches_done"]) + "/" + str(counters["join_batches"])
+        job_store.update_job(job_id, "running", message=message, result=counters)
+
+    database = settings["database"]
+    remote = settings["remote"]
+    geojson_path = entity_config["geoentity_config"]["geoJSON_file_config"]["file_path"]
+    sftp_pool = SFTPPool(remote["host"], remote["username"], remote["password"], max_size=1, idle_timeout=0)
+    conn = None
+    try:
+        conn = psycopg2.connect(database=database["db"], user=database["username"], password=database["password"], host=database["host"], port=database["port"])
+        conn.autocommit = True
+        cur = conn.cursor()
+        with sftp_pool.session() as sftp:
+            attributes = sftp.stat(geojson_path)
+            signature = file_signature(geojson_path, attributes)
+            config_hash = source_manifest.config_hash(entity_config)
+            resume = resume_point(entity_key, signature, config_hash)
+            if resume:
+                job_store.update_job(job_id, "running", message="Resuming " + entity_key + " at feature " + str(resume["feature_offset"]))
+
+            def checkpoint(geoentity_source_id, feature_offset, counters):
+                job_store.save_checkpoint(entity_key, job_id, signature, geoentity_source_id, feature_offset, counters, config_hash)
+
+            file_config = entity_config["geoentity_config"]["geoJSON_file_config"]
+            feature_id_attribute = file_config["geoJSON_info_attribute"]["feature_ID"]
+            manifest = job_store.get_manifest(entity_key) if settings.get("use_manifest", True) else None
+            if manifest and (manifest["config_hash"] != config_hash or manifest["file_path"] != geojson_path):
+                manifest = None
+
+            previous_hashes = None
+            if manifest:
+                if resume is None and manifest["file_size"] == attributes.st_size and manifest["file_mtime"] == attributes.st_mtime:
+                    print("[Info]:  " + entity_key + " geojson file unchanged since the last ingestion, nothing to do\r\n")
+                    return unchanged_counters(manifest, "unchanged")
+                previous_hashes = job_store.get_manifest_features(entity_key)
+                # the source already exists, Phase-1 must reuse it, the rows of changed features are deleted before
+                # their new version is loaded so the parent join of the other rows is kept
+                entity_config = json.loads(json.dumps(entity_config))
+                entity_config["geoentity_source"]["reprocess_flag"] = True
+                entity_config["geoentity_source"]["rejoin_parents"] = False
+
+            # One pass over the file: hashing, diff against the manifest and ingestion of added and changed features
+            builder = source_manifest.ManifestBuilder(feature_id_attribute, previous_hashes, skip=resume["feature_offset"] if resume else 0)
+            deleted = [0]
+
+            def replace_changed(frames):
+                # the filter ran over the features of a chunk before it is yielded
+                with conn.cursor() as delete_cur:
+                    for frame in frames:
+                        keys = builder.take_changed()
+                        if keys:
+                            deleted[0] += source_manifest.delete_features(delete_cur, database["geoentity_table"], manifest["geoentity_source_id"],
+                                                                          source_manifest.to_geoentity_ids(keys, file_config))
+                        yield frame
+
+            with sftp.open(geojson_path, 'r', bufsize=READ_BUFSIZE) as remote_file:
+                reader = source_manifest.HashingReader(remote_file)
+                frames = iter_feature_chunks(reader, settings["batch_size"], skip=resume["feature_offset"] if resume else 0, feature_filter=builder.accept,
+                                             columns=geoentity_bulk_loader.frame_columns(file_config))
+                if manifest:
+                    frames = replace_changed(frames)
+                geoentity_source_id, counters = GeoEntityIngest().ingest_geoentity(cur, entity_key, entity_config, database, frames=frames, batch_size=settings["batch_size"], progress=progress, spatial_join_workers=settings.get("spatial_join_workers", 4),
+                                                                                   resume=resume, checkpoint=checkpoint)
+                while reader.read(READ_BUFSIZE):
+                    pass
+            if counters is not None:
+                if manifest:
+                    removed = builder.removed()
+                    deleted[0] += source_manifest.delete_features(cur, database["geoentity_table"], geoentity_source_id, source_manifest.to_geoentity_ids(removed, file_config))
+                    counters.update(builder.stats)
+                    counters.update({"features_removed": len(removed), "rows_deleted": deleted[0]})
+                    print("[Info]:  " + entity_key + " diff ingestion: " + json.dumps(dict(builder.stats, features_removed=len(removed), rows_deleted=deleted[0])) + "\r\n")
+                    counters["manifest"] = "same content" if reader.hexdigest() == manifest["sha256"] else "diff"
+                else:
+                    counters["manifest"] = "full"
+                job_store.save_manifest(entity_key, geoentity_source_id, geojson_path, attributes.st_size, attributes.st_mtime, reader.hexdigest(), config_hash, builder.hashes)
+        cur.close()
+    except SystemExit:
+        # GeoEntityIngest exits on fatal config/duplicate errors, details are in the worker log
+        raise RuntimeError("Ingestion of " + entity_key + " aborted, see worker log for details")
+    finally:
+        if conn is not None:
+            conn.close()
+        sftp_pool.close_all()
+
+    if counters is None:
+        raise RuntimeError("Ingestion of " + entity_key + " failed, see worker log for details")
+    # Phase-2 and Phase-3 are done, a later publish starts from the beginning again
+    job_store.clear_checkpoint(entity_key)
+    counters["geoentity_source_id"] = geoentity_source_id
+    counters["resumed_from"] = resume["feature_offset"] if resume else 0
+    return counters
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Job Scheduler"
+__purpose__= "Fixed-size worker pool with a priority queue over the jobs table, one running job per entity_key."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import itertools
+import threading
+import traceback
+
+import job_store
+
+
+class JobScheduler:
+    """
+    Runs submitted jobs on max_workers threads.
+
+    Higher priority first, FIFO within a priority. A job whose entity_key is
+    already running stays queued until that job finishes, and submitting the
+    same entity_key/action while one is still queued returns the queued job.
+    Queued jobs have status 'queued' in the jobs table until a worker starts them.
+    """
+
+    def __init__(self, max_workers=2, name="job-worker"):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue = []  # [(-priority, seq, job_id, entity_key, action, target, args)]
+        self._running = {}  # entity_key -> job_id
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def start(self):
+        with self._cond:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=self.name + "-" + str(len(self._workers)), daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    #------------------------------------#
+    # Queue Handling                     #
+    #------------------------------------#
+    def submit(self, entity_key, target, args=(), action=None, priority=0, job_id=None, params=None):
+        """
+        Queues target(job_id, *args). Returns (job_id, created), created is False
+        when an identical job (same entity_key and action) was already queued.
+        job_id is given when re-queueing a job which already has its jobs row.
+        params is stored with a new job so it can be re-queued after a restart.
+        """
+        with self._cond:
+            for item in self._queue:
+                if item[3] == entity_key and item[4] == action:
+                    return item[2], False
+            if job_id is None:
+                job_id = job_store.create_job(entity_key, action=action, priority=priority, status="queued", params=params)
+            self._queue.append((-priority, next(self._seq), job_id, entity_key, action, target, args))
+            self._cond.notify()
+        self.start()
+        return job_id, True
+
+    def _next_item(self):
+        eligible = [item for item in self._queue if item[3] not in self._running]
+        if not eligible:
+            return None
+        item = min(eligible, key=lambda queued: (queued[0], queued[1]))
+        self._queue.remove(item)
+        return item
+
+    def _work(self):
+        while True:
+            with self._cond:
+                item = self._next_item()
+                while item is None:
+                    self._cond.wait()
+                    item = self._next_item()
+                job_id, entity_key, target, args = item[2], item[3], item[5], item[6]
+                self._running[entity_key] = job_id
+
+            try:
+                target(job_id, *args)
+            except (Exception, SystemExit) as e:
+                # SystemExit: ingestion code still calls sys.exit() on fatal errors, it must not kill the worker
+                traceback.print_exc()
+                job_store.update_job(job_id, "failed", message=str(e) or "Job aborted")
+            finally:
+                with self._cond:
+                    self._running.pop(entity_key, None)
+                    self._cond.notify_all()
+
+    #------------------------------------#
+    # Introspection                      #
+    #------------------------------------#
+    def position(self, job_id):
+        """
+        1 based position of a queued job in run order, None when not queued.
+        """
+        with self._cond:
+            ordered = sorted(self._queue, key=lambda queued: (queued[0], queued[1]))
+            for index, item in enumerate(ordered):
+                if item[2] == job_id:
+                    return index + 1
+        return None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_workers": self.max_workers,
+                "queued": len(self._queue),
+                "running": dict(self._running)
+            }
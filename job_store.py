@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Job Store"
+__purpose__= "SQLite backed jobs table shared by the Flask app, the scheduler and worker processes."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+
+DB_PATH = 'job_status.db'
+IST = ZoneInfo("Asia/Kolkata")
+
+
+def _connect():
+    # Several threads/processes write the same file, wait on locks instead of failing
+    return sqlite3.connect(DB_PATH, timeout=30)
+
+
+def _ensure_column(conn, table, column, definition):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(" + table + ")")]
+    if column not in columns:
+        conn.execute("ALTER TABLE " + table + " ADD COLUMN " + column + " " + definition)
+
+
+def init_db():
+    with _connect() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                entity_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                message TEXT,
+                result TEXT
+            )
+        ''')
+        # Columns added for the job scheduler, existing job_status.db files are migrated in place
+        _ensure_column(conn, "jobs", "action", "TEXT")
+        _ensure_column(conn, "jobs", "priority", "INTEGER DEFAULT 0")
+        # JSON arguments of the job, needed to queue it again after a restart
+        _ensure_column(conn, "jobs", "params", "TEXT")
+        # Progress messages of a job, tailed by the SSE endpoints
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                created_on TIMESTAMP,
+                message TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS job_events_job_id ON job_events (job_id, seq)")
+        # Last committed Phase-2 batch per geoentity key, a retried ingestion resumes from it
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                entity_key TEXT PRIMARY KEY,
+                job_id TEXT,
+                file_signature TEXT NOT NULL,
+                geoentity_source_id INTEGER NOT NULL,
+                feature_offset INTEGER NOT NULL,
+                counters TEXT,
+                updated_on TIMESTAMP
+            )
+        ''')
+        # Hash of the entity config the checkpoint was taken with, a checkpoint of another config is not resumed
+        _ensure_column(conn, "ingest_checkpoints", "config_hash", "TEXT")
+        # File and per-feature hashes of the last successful ingestion per geoentity key
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS source_manifests (
+                entity_key TEXT PRIMARY KEY,
+                geoentity_source_id INTEGER,
+                file_path TEXT,
+                file_size INTEGER,
+                file_mtime INTEGER,
+                sha256 TEXT,
+                config_hash TEXT,
+                feature_count INTEGER,
+                updated_on TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS manifest_features (
+                entity_key TEXT NOT NULL,
+                feature_key TEXT NOT NULL,
+                feature_hash TEXT NOT NULL,
+                PRIMARY KEY (entity_key, feature_key)
+            )
+        ''')
+        conn.commit()
+
+
+def create_job(entity_key, action=None, priority=0, status="queued", params=None):
+    job_id = str(uuid.uuid4())
+    started_on = datetime.now(IST).isoformat()
+    with _connect() as conn:
+        conn.execute("""
+            INSERT INTO jobs (job_id, entity_key, status, started_on, message, action, priority, params)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, entity_key, status, started_on, "Job submitted", action, priority, json.dumps(params) if params else None))
+        conn.commit()
+    return job_id
+
+
+def update_job(job_id, status, message=None, result=None):
+    with _connect() as conn:
+        conn.execute("""
+            UPDATE jobs SET status=?, message=?, result=?
+            WHERE job_id=?
+        """, (
+            status,
+            message,
+            json.dumps(result) if result else None,
+            job_id
+        ))
+        conn.commit()
+
+
+def _row_to_job(row):
+    return {
+        "job_id": row[0],
+        "entity_key": row[1],
+        "status": row[2],
+        "started_on": row[3],
+        "message": row[4],
+        "result": json.loads(row[5]) if row[5] else None,
+        "action": row[6],
+        "priority": row[7],
+        "params": json.loads(row[8]) if row[8] else None
+    }
+
+
+def get_job_status(job_id):
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT job_id, entity_key, status, started_on, message, result, action, priority, params
+            FROM jobs WHERE job_id=?
+        """, (job_id,))
+        row = cursor.fetchone()
+        if row:
+            return _row_to_job(row)
+        return None
+
+
+def list_jobs(status):
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT job_id, entity_key, status, started_on, message, result, action, priority, params
+            FROM jobs WHERE status=? ORDER BY started_on
+        """, (status,))
+        return [_row_to_job(row) for row in cursor.fetchall()]
+
+
+def latest_job(entity_key, action=None):
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT job_id, entity_key, status, started_on, message, result, action, priority, params
+            FROM jobs WHERE entity_key=? AND (? IS NULL OR action=?) ORDER BY started_on DESC LIMIT 1
+        """, (entity_key, action, action))
+        row = cursor.fetchone()
+        if row:
+            return _row_to_job(row)
+        return None
+
+
+def add_job_event(job_id, message):
+    with _connect() as conn:
+        conn.execute("""
+            INSERT INTO job_events (job_id, created_on, message) VALUES (?, ?, ?)
+        """, (job_id, datetime.now(IST).isoformat(), message))
+        conn.commit()
+
+
+def get_job_events(job_id, after_seq=0):
+    """
+    Events of job_id newer than after_seq as [{"seq", "created_on", "message"}], oldest first.
+    """
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT seq, created_on, message FROM job_events
+            WHERE job_id=? AND seq>? ORDER BY seq
+        """, (job_id, after_seq))
+        return [{"seq": row[0], "created_on": row[1], "message": row[2]} for row in cursor.fetchall()]
+
+
+def save_checkpoint(entity_key, job_id, file_signature, geoentity_source_id, feature_offset, counters, config_hash=None):
+    with _connect() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO ingest_checkpoints (entity_key, job_id, file_signature, geoentity_source_id, feature_offset, counters, updated_on, config_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (entity_key, job_id, file_signature, geoentity_source_id, feature_offset, json.dumps(counters), datetime.now(IST).isoformat(), config_hash))
+        conn.commit()
+
+
+def get_checkpoint(entity_key):
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT entity_key, job_id, file_signature, geoentity_source_id, feature_offset, counters, updated_on, config_hash
+            FROM ingest_checkpoints WHERE entity_key=?
+        """, (entity_key,))
+        row = cursor.fetchone()
+        if row:
+            return {
+                "entity_key": row[0],
+                "job_id": row[1],
+                "file_signature": row[2],
+                "geoentity_source_id": row[3],
+                "feature_offset": row[4],
+                "counters": json.loads(row[5]) if row[5] else None,
+                "updated_on": row[6],
+                "config_hash": row[7]
+            }
+        return None
+
+
+def clear_checkpoint(entity_key):
+    with _connect() as conn:
+        conn.execute("DELETE FROM ingest_checkpoints WHERE entity_key=?", (entity_key,))
+        conn.commit()
+
+
+def get_manifest(entity_key):
+    with _connect() as conn:
+        cursor = conn.execute("""
+            SELECT entity_key, geoentity_source_id, file_path, file_size, file_mtime, sha256, config_hash, feature_count, updated_on
+            FROM source_manifests WHERE entity_key=?
+        """, (entity_key,))
+        row = cursor.fetchone()
+        if row:
+            return {
+                "entity_key": row[0],
+                "geoentity_source_id": row[1],
+                "file_path": row[2],
+                "file_size": row[3],
+                "file_mtime": row[4],
+                "sha256": row[5],
+                "config_hash": row[6],
+                "feature_count": row[7],
+                "updated_on": row[8]
+            }
+        return None
+
+
+def get_manifest_features(entity_key):
+    with _connect() as conn:
+        cursor = conn.execute("SELECT feature_key, feature_hash FROM manifest_features WHERE entity_key=?", (entity_key,))
+        return dict(cursor.fetchall())
+
+
+def save_manifest(entity_key, geoentity_source_id, file_path, file_size, file_mtime, sha256, config_hash, feature_hashes=None):
+    """
+    Replaces the manifest of entity_key, feature_hashes None keeps the stored feature hashes (file touched, content unchanged).
+    """
+    with _connect() as conn:
+        if feature_hashes is None:
+            feature_count = conn.execute("SELECT COUNT(*) FROM manifest_features WHERE entity_key=?", (entity_key,)).fetchone()[0]
+        else:
+            feature_count = len(feature_hashes)
+            conn.execute("DELETE FROM manifest_features WHERE entity_key=?", (entity_key,))
+            conn.executemany("INSERT INTO manifest_features (entity_key, feature_key, feature_hash) VALUES (?, ?, ?)",
+                             ((entity_key, key, digest) for key, digest in feature_hashes.items()))
+        conn.execute("""
+            INSERT OR REPLACE INTO source_manifests (entity_key, geoentity_source_id, file_path, file_size, file_mtime, sha256, config_hash, feature_count, updated_on)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (entity_key, geoentity_source_id, file_path, file_size, file_mtime, sha256, config_hash, feature_count, datetime.now(IST).isoformat()))
+        conn.commit()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Parent Lookup"
+__purpose__= "In-process parent assignment with a shapely STRtree, so children are inserted with their parent already set."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import numpy as np
+import shapely
+
+
+class ParentIndex:
+    """
+    STRtree over the geometries of one parent source.
+
+    lookup() maps a batch of child geometries to the parent containing their
+    representative point, the same rule as the Phase-3 join (spatial_join),
+    so children left unmatched here are still picked up by Phase-3.
+    """
+
+    def __init__(self, parent_source_id, geoentity_ids, names, geoms, point_function="point_on_surface"):
+        self.parent_source_id = parent_source_id
+        self.geoentity_ids = np.asarray(geoentity_ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.tree = shapely.STRtree(geoms)
+        self._point = getattr(shapely, point_function)
+
+    @classmethod
+    def from_database(cls, cur, geoentity_table, parent_source_id, point_function="point_on_surface"):
+        cur.execute("SELECT geoentity_id, name, ST_AsBinary(geom) FROM " + geoentity_table + " WHERE geoentity_source_id = %s AND geom IS NOT NULL", (parent_source_id,))
+        rows = cur.fetchall()
+        geoentity_ids = [row[0] for row in rows]
+        names = [row[1] for row in rows]
+        geoms = shapely.from_wkb([bytes(row[2]) for row in rows])
+        print("[Info]:  Parent lookup index built over " + str(len(rows)) + " geoentities of source " + str(parent_source_id) + "\r\n")
+        return cls(parent_source_id, geoentity_ids, names, geoms, point_function)
+
+    def __len__(self):
+        return len(self.geoentity_ids)
+
+    def lookup(self, geoms):
+        """
+        Returns (parent_ids, parent_names) object arrays aligned with geoms, None where no parent contains the point.
+        When several parents match (overlapping parents) the first one of the tree is kept.
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        parent_ids = np.full(len(geoms), None, dtype=object)
+        parent_names = np.full(len(geoms), None, dtype=object)
+        if len(geoms) == 0 or len(self) == 0:
+            return parent_ids, parent_names
+
+        valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+        points = np.full(len(geoms), None, dtype=object)
+        points[valid] = self._point(geoms[valid])
+        child_index, parent_index = self.tree.query(points, predicate="within")
+        child_index, first = np.unique(child_index, return_index=True)
+        parent_index = parent_index[first]
+        parent_ids[child_index] = self.geoentity_ids[parent_index]
+        parent_names[child_index] = self.names[parent_index]
+        return parent_ids, parent_names
+
+    def assign(self, records, geoms):
+        """
+        Extends (geoentity_id, name, geom, auxdata) records with parent_id and parent_name,
+        matched geoentity_id get the parent geoentity_id prefix as in the Phase-3 update.
+        """
+        parent_ids, parent_names = self.lookup(geoms)
+        assigned = []
+        for record, parent_id, parent_name in zip(records, parent_ids, parent_names):
+            geoentity_id = record[0] if parent_id is None else str(parent_id) + str(record[0])
+            assigned.append((geoentity_id, record[1], record[2], record[3], parent_id, parent_name))
+        return assigned
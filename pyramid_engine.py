@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Pyramid Engine"
+__purpose__= "Pyramid level generation split into geoentity_id hash buckets running concurrently over a connection pool."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Level 0 is the original geometry, then coarser and coarser simplification
+TOLERANCES = ["0.08192","0.04096","0.02048","0.01024","0.00512", "0.00256", "0.00128", "0.00064","0.00032","0.00016","0.00008", "0.00004", "0.00002", "0.00001","original"]
+TOLERANCES.reverse()
+DEFAULT_PARALLELISM = 4
+MODES = ("levels", "onepass")
+PYRAMID_TABLE = "geoentity_pyramid_levels"
+STATE_TABLE = "geoentity_pyramid_state"
+SUMMARY_TABLE = "geoentity_pyramid_summary"
+
+
+def gridsize(tolerance):
+    gridsize = str(0.000001)
+    if(float(tolerance)>0.00001):
+        gridsize = str(0.00001)
+    if(float(tolerance)>0.0001):
+        gridsize = str(0.0001)
+    if(float(tolerance)>0.001):
+        gridsize = str(0.001)
+    return gridsize
+
+
+def level_for_resolution(resolution):
+    """
+    Coarsest level whose simplification tolerance is not larger than resolution (degrees per pixel),
+    level 0 (original geometry) when even the finest tolerance is too coarse.
+    """
+    for level in range(len(TOLERANCES) - 1, 0, -1):
+        if float(TOLERANCES[level]) <= resolution:
+            return level
+    return 0
+
+
+def level_for_zoom(zoom, tile_size=256):
+    # Web map zoom to the degrees covered by one screen pixel at the equator
+    return level_for_resolution(360.0 / (tile_size * 2 ** zoom))
+
+
+def bucket_filter(buckets):
+    # hashtext spreads geoentity_id evenly, the same id always lands in the same bucket at every level
+    if buckets <= 1:
+        return ""
+    return " AND mod(hashtext(geoentity_id) & 2147483647, " + str(int(buckets)) + ") = %(bucket)s"
+
+
+def changed_filter(changed_table):
+    if changed_table is None:
+        return ""
+    return " AND geoentity_id IN (SELECT geoentity_id FROM " + changed_table + ")"
+
+
+def level_query(geoentity_source_id, level, is_polygon, buckets=1, changed_table=None):
+    """
+    INSERT of one pyramid level (for one bucket when buckets > 1), the same statements as the sequential cascade.
+    changed_table restricts it to the geoentity_id listed there (incremental builds).
+    """
+    insert_prefix = "INSERT INTO " + PYRAMID_TABLE + " (geoentity_source_id,geoentity_id,level,geom) "
+    source_filter = "geoentity_source_id = " + str(int(geoentity_source_id))
+    if level == 0:
+        return insert_prefix + " SELECT geoentity_source_id, geoentity_id, 0, geom FROM geoentity where " + source_filter + " " + ("and ST_IsValid(ST_Buffer(geom,0))" if is_polygon else " ") + bucket_filter(buckets) + changed_filter(changed_table)
+    tolerance = TOLERANCES[level]
+    geom = ("ST_MakeValid(ST_Buffer(ST_SnapToGrid(ST_SimplifyPreserveTopology(geom," + tolerance + "),0,0," + gridsize(tolerance) + "," + gridsize(tolerance) + "),0))" if is_polygon else "geom")
+    return insert_prefix + " SELECT geoentity_source_id, geoentity_id," + str(level) + ", " + geom + " FROM " + PYRAMID_TABLE + " where " + source_filter + " and level=" + str(level - 1) + " AND geom IS NOT NULL AND NOT ST_IsEmpty(geom) AND ST_IsValid(geom)" + bucket_filter(buckets) + changed_filter(changed_table)
+
+
+def onepass_query(geoentity_source_id, is_polygon, buckets=1, changed_table=None):
+    """
+    INSERT of all the levels of a bucket in one statement: a recursive CTE applies the
+    same per-level expression and validity filter as level_query to the previous level
+    in memory, the source geometries are read once and nothing is re-read from the pyramid table.
+    """
+    tolerance_rows = ", ".join("(" + str(level) + ", " + TOLERANCES[level] + "::float8, " + gridsize(TOLERANCES[level]) + "::float8)" for level in range(1, len(TOLERANCES)))
+    geom = ("ST_MakeValid(ST_Buffer(ST_SnapToGrid(ST_SimplifyPreserveTopology(c.geom,t.tolerance),0,0,t.gridsize,t.gridsize),0))" if is_polygon else "c.geom")
+    return ("WITH RECURSIVE tol(level, tolerance, gridsize) AS (VALUES " + tolerance_rows + "),"
+            + " cascade(geoentity_source_id, geoentity_id, level, geom) AS ("
+            + "SELECT geoentity_source_id, geoentity_id, 0, geom FROM geoentity where geoentity_source_id = " + str(int(geoentity_source_id)) + " " + ("and ST_IsValid(ST_Buffer(geom,0))" if is_polygon else " ") + bucket_filter(buckets) + changed_filter(changed_table)
+            + " UNION ALL SELECT c.geoentity_source_id, c.geoentity_id, t.level, " + geom + " FROM cascade c JOIN tol t ON t.level = c.level + 1"
+            + " WHERE c.geom IS NOT NULL AND NOT ST_IsEmpty(c.geom) AND ST_IsValid(c.geom))"
+            + " INSERT INTO " + PYRAMID_TABLE + " (geoentity_source_id,geoentity_id,level,geom) SELECT geoentity_source_id, geoentity_id, level, geom FROM cascade")
+
+
+#------------------------------------#
+# Change Tracking                    #
+#------------------------------------#
+def create_state_table(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS " + STATE_TABLE + " (geoentity_source_id integer NOT NULL, geoentity_id varchar NOT NULL, geom_hash text NOT NULL, PRIMARY KEY (geoentity_source_id, geoentity_id))")
+
+
+def _hash_expression(column="geom"):
+    return "md5(ST_AsEWKB(" + column + "))"
+
+
+def prepare_changes(cur, geoentity_source_id):
+    """
+    Purpose
+    ----------
+    Compares the geometry hash of every geoentity of the source with the hash recorded at the last build.
+    New or modified ids go to an unlogged work table (read by every bucket connection), the pyramid
+    levels of modified and removed ids are deleted.
+
+    Returns
+    -------
+    (changed_table, changed, removed)
+    """
+    source_id = int(geoentity_source_id)
+    changed_table = "geoentity_pyramid_changed_" + str(source_id)
+    cur.execute("DROP TABLE IF EXISTS " + changed_table)
+    cur.execute("CREATE UNLOGGED TABLE " + changed_table + " AS SELECT g.geoentity_id, " + _hash_expression("g.geom") + " AS geom_hash FROM geoentity g"
+                + " LEFT JOIN " + STATE_TABLE + " s ON s.geoentity_source_id = g.geoentity_source_id AND s.geoentity_id = g.geoentity_id"
+                + " WHERE g.geoentity_source_id = %s AND (s.geom_hash IS NULL OR s.geom_hash <> " + _hash_expression("g.geom") + ")", (source_id,))
+    changed = cur.rowcount
+    cur.execute("CREATE INDEX ON " + changed_table + " (geoentity_id)")
+    cur.execute("ANALYZE " + changed_table)
+
+    cur.execute("DELETE FROM " + STATE_TABLE + " s WHERE s.geoentity_source_id = %s AND NOT EXISTS (SELECT 1 FROM geoentity g WHERE g.geoentity_source_id = s.geoentity_source_id AND g.geoentity_id = s.geoentity_id)", (source_id,))
+    removed = cur.rowcount
+    cur.execute("DELETE FROM " + PYRAMID_TABLE + " p WHERE p.geoentity_source_id = %s AND (p.geoentity_id IN (SELECT geoentity_id FROM " + changed_table + ")"
+                + " OR NOT EXISTS (SELECT 1 FROM geoentity g WHERE g.geoentity_source_id = p.geoentity_source_id AND g.geoentity_id = p.geoentity_id))", (source_id,))
+    return changed_table, changed, removed
+
+
+def record_state(cur, geoentity_source_id, changed_table=None):
+    # Hashes are recorded only once the levels are built, a failed build is redone next time
+    source_id = int(geoentity_source_id)
+    if changed_table is None:
+        cur.execute("DELETE FROM " + STATE_TABLE + " WHERE geoentity_source_id = %s", (source_id,))
+        cur.execute("INSERT INTO " + STATE_TABLE + " (geoentity_source_id, geoentity_id, geom_hash) SELECT geoentity_source_id, geoentity_id, " + _hash_expression() + " FROM geoentity WHERE geoentity_source_id = %s", (source_id,))
+    else:
+        cur.execute("INSERT INTO " + STATE_TABLE + " (geoentity_source_id, geoentity_id, geom_hash) SELECT %s, geoentity_id, geom_hash FROM " + changed_table
+                    + " ON CONFLICT (geoentity_source_id, geoentity_id) DO UPDATE SET geom_hash = EXCLUDED.geom_hash", (source_id,))
+
+
+#------------------------------------#
+# Per-source Summary                 #
+#------------------------------------#
+def create_summary_table(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS " + SUMMARY_TABLE + " (geoentity_source_id integer PRIMARY KEY, level_count integer NOT NULL, row_count bigint NOT NULL,"
+                + " level_rows jsonb NOT NULL, last_built_on timestamptz NOT NULL DEFAULT now(), build_seconds double precision)")
+
+
+def record_summary(cur, geoentity_source_id, build_seconds=None):
+    """
+    Purpose
+    ----------
+    Stores the level count and rows per level of one source, so status pages read a one row
+    lookup instead of scanning the pyramid table. Only the rows of this source are counted.
+
+    Returns
+    -------
+    {"level_count", "row_count"}
+    """
+    source_id = int(geoentity_source_id)
+    cur.execute("SELECT level, count(*) FROM " + PYRAMID_TABLE + " WHERE geoentity_source_id = %s GROUP BY level ORDER BY level", (source_id,))
+    level_rows = {str(level): count for level, count in cur.fetchall()}
+    row_count = sum(level_rows.values())
+    cur.execute("INSERT INTO " + SUMMARY_TABLE + " (geoentity_source_id, level_count, row_count, level_rows, last_built_on, build_seconds) VALUES (%s, %s, %s, %s::jsonb, now(), %s)"
+                + " ON CONFLICT (geoentity_source_id) DO UPDATE SET level_count = EXCLUDED.level_count, row_count = EXCLUDED.row_count,"
+                + " level_rows = EXCLUDED.level_rows, last_built_on = EXCLUDED.last_built_on, build_seconds = EXCLUDED.build_seconds",
+                (source_id, len(level_rows), row_count, json.dumps(level_rows), build_seconds))
+    return {"level_count": len(level_rows), "row_count": row_count}
+
+
+def backfill_summary(cur):
+    """
+    Summarizes the sources with pyramid levels built before the summary table existed,
+    one index probe per unsummarized source. Returns the number of sources added.
+    """
+    create_summary_table(cur)
+    cur.execute("SELECT gs.id FROM geoentity_source gs WHERE NOT EXISTS (SELECT 1 FROM " + SUMMARY_TABLE + " s WHERE s.geoentity_source_id = gs.id)"
+                + " AND EXISTS (SELECT 1 FROM " + PYRAMID_TABLE + " p WHERE p.geoentity_source_id = gs.id)")
+    source_ids = [row[0] for row in cur.fetchall()]
+    for source_id in source_ids:
+        record_summary(cur, source_id)
+    return len(source_ids)
+
+
+def _run_chunk(db_pool, query, bucket):
+    start = time.time()
+    with db_pool.connection(statement_timeout=0) as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, {"bucket": bucket})
+            rows = cur.rowcount
+    return rows, time.time() - start
+
+
+def build_pyramids(db_pool, geoentity_source_id, is_polygon=True, parallelism=DEFAULT_PARALLELISM, buckets=None, mode="levels", incremental=False):
+    """
+    Purpose
+    ----------
+    Rebuilds all the pyramid levels of a source. Every level is split into hash buckets of
+    geoentity_id run concurrently, each bucket on its own pooled connection and transaction.
+    A level starts once all the buckets of the previous level are committed.
+    mode "onepass" computes all the levels of a bucket in a single statement instead (onepass_query).
+    incremental only rebuilds the geoentities whose geometry hash changed since the last build
+    and drops the levels of removed ones, a source never built before is built entirely.
+    The per-source summary (SUMMARY_TABLE) is refreshed once the build is committed.
+
+    Parameters
+    ----------
+    db_pool : db_pool.PooledDB
+    geoentity_source_id : source to build
+    is_polygon : False for point/line sources (no simplification)
+    parallelism : concurrent buckets, capped to the pool size minus one connection left for requests
+    buckets : hash buckets per level, defaults to parallelism
+    mode : "levels" (level by level) or "onepass"
+    incremental : rebuild changed geoentities only
+
+    Returns
+    -------
+    Generator of progress messages, raises the first failed chunk error once its level is done.
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown pyramid mode " + str(mode) + ", expected one of " + ", ".join(MODES))
+    parallelism = max(1, min(int(parallelism), db_pool.maxconn - 1))
+    buckets = int(buckets or parallelism)
+
+    start = time.time()
+    changed_table = None
+    with db_pool.connection(statement_timeout=0) as conn:
+        with conn.cursor() as cur:
+            create_state_table(cur)
+            create_summary_table(cur)
+            if incremental:
+                changed_table, changed, removed = prepare_changes(cur, geoentity_source_id)
+            else:
+                cur.execute("DELETE FROM " + PYRAMID_TABLE + " where geoentity_source_id = %s", (int(geoentity_source_id),))
+                # the levels are gone until the rebuild completes, without hashes a failed rebuild is redone by the next incremental build
+                cur.execute("DELETE FROM " + STATE_TABLE + " WHERE geoentity_source_id = %s", (int(geoentity_source_id),))
+                cur.execute("DELETE FROM " + SUMMARY_TABLE + " WHERE geoentity_source_id = %s", (int(geoentity_source_id),))
+    if incremental:
+        yield f"Incremental build of {geoentity_source_id}: {changed} new or modified, {removed} removed geoentities"
+        if changed == 0:
+            _drop_changed_table(db_pool, changed_table)
+            _record_summary(db_pool, geoentity_source_id, time.time() - start)
+            yield f"Pyramid levels of {geoentity_source_id} are up to date"
+            return
+    else:
+        yield f"Deleted previous pyramid levels of {geoentity_source_id}, building with {parallelism} workers over {buckets} buckets"
+
+    try:
+        yield from _build_levels(db_pool, geoentity_source_id, is_polygon, parallelism, buckets, mode, changed_table)
+        with db_pool.connection(statement_timeout=0) as conn:
+            with conn.cursor() as cur:
+                record_state(cur, geoentity_source_id, changed_table)
+        summary = _record_summary(db_pool, geoentity_source_id, time.time() - start)
+        yield f"Summary of {geoentity_source_id}: {summary['level_count']} levels, {summary['row_count']} rows"
+    finally:
+        if changed_table is not None:
+            _drop_changed_table(db_pool, changed_table)
+
+
+def _record_summary(db_pool, geoentity_source_id, build_seconds):
+    with db_pool.connection(statement_timeout=0) as conn:
+        with conn.cursor() as cur:
+            return record_summary(cur, geoentity_source_id, round(build_seconds, 3))
+
+
+def _drop_changed_table(db_pool, changed_table):
+    with db_pool.connection(autocommit=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS " + changed_table)
+
+
+def _build_levels(db_pool, geoentity_source_id, is_polygon, parallelism, buckets, mode, changed_table):
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="pyramid") as executor:
+        if mode == "onepass":
+            yield f"Ingesting all {len(TOLERANCES)} levels in one pass"
+            query = onepass_query(geoentity_source_id, is_polygon, buckets, changed_table)
+            futures = {executor.submit(_run_chunk, db_pool, query, bucket): bucket for bucket in range(buckets)}
+            rows = 0
+            error = None
+            for future in as_completed(futures):
+                try:
+                    chunk_rows, seconds = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                rows = rows + chunk_rows
+                yield f"Bucket {futures[future]} completed, {chunk_rows} rows in {round(seconds, 2)} s"
+            if error is not None:
+                raise error
+        else:
+            for level in range(len(TOLERANCES)):
+                level_start = time.time()
+                query = level_query(geoentity_source_id, level, is_polygon, buckets, changed_table)
+                yield f"Ingesting {level} {TOLERANCES[level]}" + ("" if level == 0 else " " + gridsize(TOLERANCES[level]))
+                futures = [executor.submit(_run_chunk, db_pool, query, bucket) for bucket in range(buckets)]
+                rows = 0
+                error = None
+                for future in as_completed(futures):
+                    try:
+                        rows = rows + future.result()[0]
+                    except Exception as e:
+                        error = error or e
+                if error is not None:
+                    raise error
+                yield f"Level {level} completed, {rows} rows in {round(time.time() - level_start, 2)} s"
+    yield f"All levels built in {round(time.time() - start, 2)} s"
@@ -1,19 +1,15 @@
+import os
+import threading
 import time
-from flask import Flask
-import psycopg2
-import requests
-
-
-# SELECT
-#     gs.id, gs.name
-# FROM
-#     public.geoentity_source AS gs
-# LEFT JOIN
-#     public.geoentity_pyramid_levels AS gpl
-# ON
-#     gs.id = gpl.geoentity_source_id
-# WHERE
-#     gpl.geoentity_source_id IS NULL;
+from flask import Flask, jsonify
+from db_pool import PooledDB
+import pyramid_engine
+from source_catalog import SourceCatalog
+from ttl_cache import TTLCache, cached_json_response
+
+
+# Pyramid availability comes from the per-source summary kept by pyramid_engine.build_pyramids:
+# SELECT geoentity_source_id, level_count, row_count, last_built_on FROM public.geoentity_pyramid_summary;
 
 app = Flask(__name__)
 
@@ -26,89 +22,89 @@ DATABASE_CONFIG = {
     "port": "5433"
 }
 
-# External API endpoint
-SOURCE_API_URL = "https://vedas.sac.gov.in/geoentity-services/api/geoentity-sources/"
+# Pooled connections instead of a connect per request
+db_pool = PooledDB(database=DATABASE_CONFIG["dbname"], user=DATABASE_CONFIG["user"], password=DATABASE_CONFIG["password"],
+                   host=DATABASE_CONFIG["host"], port=DATABASE_CONFIG["port"], maxconn=5)
+
+# Local copy of the external geoentity-sources API
+source_catalog = SourceCatalog()
+
+# Served from memory, reloaded in the background once older than this (seconds)
+STATUS_TTL = int(os.getenv("PYRAMID_STATUS_TTL", "30"))
+
+
+def load_pyramid_status():
+    # Sources from the external API merged with the per-source summary maintained by the pyramid builder
+    start_backfill()
+    api_data = source_catalog.sources()
+
+    db_start = time.time()
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            pyramid_engine.create_summary_table(cur)
+            cur.execute("SELECT geoentity_source_id, level_count, row_count, last_built_on FROM " + pyramid_engine.SUMMARY_TABLE)
+            summaries = {row[0]: row for row in cur.fetchall()}
+    print(f"Queried pyramid summary in {time.time() - db_start:.2f} seconds")
+
+    final_results = []
+    for source in api_data:
+        source_id = source.get("id")
+        source_name = source.get("name")
+        if source_id is not None and source_name is not None:
+            summary = summaries.get(source_id)
+            final_results.append({
+                "id": source_id,
+                "name": source_name,
+                "pyramid_levels_available": 'yes' if summary else 'no',
+                "level_count": summary[1] if summary else 0,
+                "row_count": summary[2] if summary else 0,
+                "last_built_on": summary[3].isoformat() if summary else None
+            })
+    return final_results
+
+
+pyramid_status_cache = TTLCache(load_pyramid_status, ttl=STATUS_TTL, name="Pyramid status")
+
+
+_backfill_lock = threading.Lock()
+_backfill_started = False
+
+
+def start_backfill():
+    # Started by the first status load whatever serves the app (WSGI server or __main__), once per process
+    global _backfill_started
+    with _backfill_lock:
+        if _backfill_started:
+            return
+        _backfill_started = True
+    threading.Thread(target=backfill_summary, name="pyramid-summary-backfill", daemon=True).start()
+
+
+def backfill_summary():
+    # Sources built before the summary table existed, done once in the background
+    global _backfill_started
+    try:
+        with db_pool.connection(statement_timeout=0) as conn:
+            with conn.cursor() as cur:
+                added = pyramid_engine.backfill_summary(cur)
+        print(f"Backfilled pyramid summary of {added} sources")
+        if added:
+            pyramid_status_cache.invalidate()
+    except Exception as e:
+        print("Pyramid summary backfill failed:", e)
+        # retried by the next status load
+        with _backfill_lock:
+            _backfill_started = False
 
 
 @app.route("/check-pyramid-levels", methods=["GET"])
 def check_pyramid_levels():
-    print("Received request to /check-pyramid-levels")
-    
-    print("Starting cache update...")
     try:
-        print("Fetching from API...")
-        api_start = time.time()
-        # Step 1: Fetch source data from external API
-        response = requests.get(SOURCE_API_URL)
-        response.raise_for_status()
-        api_data = response.json().get("data", [])
-        
-        print(f"Fetched API data in {time.time() - api_start:.2f} seconds")
-
-        # Step 2: Get a list of IDs to check
-        source_ids = [source.get("id") for source in api_data if source.get("id") is not None]
-
-        if not source_ids:
-            print("No source IDs found from API.")
-            return
-
-        print(f"Number of source IDs: {len(source_ids)}")
-        print("First few IDs:", source_ids[:5])
-
-        print("Querying the database...")
-        db_start = time.time()
-
-
-        # Step 3: Query the database
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        print("Connected")
-        cur = conn.cursor()
-        sql_query = """
-            SELECT
-                gs.id, gs.name
-            FROM
-                public.geoentity_source AS gs
-            LEFT JOIN
-                public.geoentity_pyramid_levels AS gpl
-            ON
-                gs.id = gpl.geoentity_source_id
-            WHERE
-                gpl.geoentity_source_id IS NULL;
-        """
-        
-        print(sql_query)
-        cur.execute(sql_query, (source_ids,))
-        print("Query executed")
-        db_results = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        print(f"Queried DB in {time.time() - db_start:.2f} seconds", db_results)
-
-
-        print("Merging and saving data...")
-        # merge_start = time.time()
-
-
-
-        # Step 4: Combine data
-        db_map = {row[0]: row[1] for row in db_results}
-        final_results = []
-        for source in api_data:
-            source_id = source.get("id")
-            source_name = source.get("name")
-            if source_id is not None and source_name is not None:
-                pyramid_status = 'no' if source_id in db_map else 'yes'
-                final_results.append({
-                    "id": source_id,
-                    "name": source_name,
-                    "pyramid_levels_available": pyramid_status
-                })
-        return final_results
+        return cached_json_response(pyramid_status_cache.get())
     except Exception as e:
-        print("error is",e)
-                
-        
+        print("error is", e)
+        return jsonify({"error": str(e)}), 502
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=False)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Remote Config Cache"
+__purpose__= "In-process cache of the remote config.json keyed on its stat() mtime/size with compare-and-swap writes."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+
+class ConfigConflictError(Exception):
+    """Raised when the remote config changed between read and write."""
+
+
+class RemoteConfigCache:
+    """
+    Parsed copies of remote json config files, fetched over a SFTPPool.
+
+    get() only re-transfers a file when its (st_mtime, st_size) differs from
+    the cached version, callers always receive a deep copy they can modify.
+    The version also holds the SHA-1 of the content: write() is a compare-and-swap
+    on it (re-hashing the remote file, a same-second same-size change is caught)
+    and goes through a temp file + posix_rename so readers never see a half written config.
+    """
+
+    def __init__(self, sftp_pool, stat_interval=1.0, max_retries=5):
+        self.sftp_pool = sftp_pool
+        self.stat_interval = stat_interval
+        self.max_retries = max_retries
+        self._entries = {}  # path -> {"version", "data", "checked_on"}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _stat_version(attrs):
+        return (int(attrs.st_mtime), int(attrs.st_size))
+
+    @staticmethod
+    def _read(sftp, path):
+        with sftp.open(path, 'rb') as remote_file:
+            content = remote_file.read()
+        return content, hashlib.sha1(content).hexdigest()
+
+    def _load(self, sftp, path):
+        content, digest = self._read(sftp, path)
+        data = json.loads(content)
+        # stat after the read, a change in between only causes one extra download
+        version = self._stat_version(sftp.stat(path)) + (digest,)
+        self._entries[path] = {"version": version, "data": data, "checked_on": time.time()}
+        return self._entries[path]
+
+    def get(self, path, with_version=False):
+        """
+        Returns the parsed config (deep copy), and its version when with_version is set.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or time.time() - entry["checked_on"] >= self.stat_interval:
+                with self.sftp_pool.session() as sftp:
+                    if entry is not None and self._stat_version(sftp.stat(path)) == entry["version"][:2]:
+                        entry["checked_on"] = time.time()
+                    else:
+                        entry = self._load(sftp, path)
+            data = copy.deepcopy(entry["data"])
+            if with_version:
+                return data, entry["version"]
+            return data
+
+    def write(self, path, config_data, expected_version):
+        """
+        Writes config_data only when the remote file still has expected_version,
+        otherwise raises ConfigConflictError. Returns the new version.
+        """
+        text = json.dumps(config_data, indent=4)
+        with self._lock:
+            with self.sftp_pool.session() as sftp:
+                current_version = self._stat_version(sftp.stat(path))
+                if current_version == expected_version[:2]:
+                    # same mtime second and size, only the content tells
+                    current_version = current_version + (self._read(sftp, path)[1],)
+                if current_version != expected_version:
+                    self._entries.pop(path, None)
+                    raise ConfigConflictError(path + " changed since it was read " + str(expected_version) + " -> " + str(current_version))
+
+                content = text.encode("utf-8")
+                tmp_path = path + ".tmp-" + uuid.uuid4().hex
+                with sftp.open(tmp_path, 'wb') as remote_file:
+                    remote_file.write(content)
+                sftp.posix_rename(tmp_path, path)
+
+                version = self._stat_version(sftp.stat(path)) + (hashlib.sha1(content).hexdigest(),)
+                # write-through, the next get() does not download what we just wrote
+                self._entries[path] = {"version": version, "data": copy.deepcopy(config_data), "checked_on": time.time()}
+                return version
+
+    def update(self, path, mutator):
+        """
+        Read-modify-write of the config: mutator(config_data) changes the dict in
+        place, the write is retried on a fresh copy when another writer got in
+        between. Returns the config as written.
+        """
+        for attempt in range(self.max_retries):
+            config_data, version = self.get(path, with_version=True)
+            mutator(config_data)
+            try:
+                self.write(path, config_data, version)
+                return config_data
+            except ConfigConflictError as e:
+                print("[Warning]: " + str(e) + ", retrying (" + str(attempt + 1) + ")\r\n")
+        raise ConfigConflictError(path + " kept changing, update abandoned after " + str(self.max_retries) + " attempts")
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries = {}
+            else:
+                self._entries.pop(path, None)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "SFTP Session Pool"
+__purpose__= "Shares authenticated paramiko SFTP sessions between Flask routes and worker threads."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import paramiko
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SFTPPool:
+    """
+    Thread-safe pool of (SSHClient, SFTPClient) pairs for one remote host.
+
+    Sessions are created lazily up to max_size, kept alive with SSH keepalive
+    packets, health checked before being handed out after health_check_after
+    seconds of idling and closed once idle for more than idle_timeout seconds.
+    """
+
+    def __init__(self, host, username, password, port=22, max_size=4, idle_timeout=300, keepalive=30, health_check_after=30, acquire_timeout=120):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = []  # [(ssh, sftp, last_used)]
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._janitor = None
+        self._closed = False
+
+    #------------------------------------#
+    # Connection Handling                #
+    #------------------------------------#
+    def _connect(self):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(self.host, port=self.port, username=self.username, password=self.password)
+        ssh.get_transport().set_keepalive(self.keepalive)
+        return ssh, ssh.open_sftp()
+
+    @staticmethod
+    def _close(ssh, sftp):
+        try:
+            sftp.close()
+        except Exception:
+            pass
+        try:
+            ssh.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(ssh, sftp, deep):
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if deep:
+            try:
+                sftp.normalize(".")
+            except Exception:
+                return False
+        return True
+
+    def _start_janitor(self):
+        if self._janitor is None and self.idle_timeout:
+            self._janitor = threading.Thread(target=self._janitor_loop, name="sftp-pool-janitor", daemon=True)
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        while not self._closed:
+            time.sleep(max(1, self.idle_timeout / 2))
+            self.evict_idle()
+
+    #------------------------------------#
+    # Public Methods                     #
+    #------------------------------------#
+    def acquire(self):
+        """
+        Returns an (ssh, sftp) pair, reusing an idle healthy session when possible.
+        Blocks while max_size sessions are borrowed.
+        """
+        deadline = time.time() + self.acquire_timeout
+        with self._cond:
+            self._start_janitor()
+            while True:
+                while self._idle:
+                    ssh, sftp, last_used = self._idle.pop()
+                    if self._is_healthy(ssh, sftp, time.time() - last_used > self.health_check_after):
+                        self._in_use += 1
+                        return ssh, sftp
+                    self._close(ssh, sftp)
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("No SFTP session available for " + self.host + " within " + str(self.acquire_timeout) + " seconds")
+                self._cond.wait(remaining)
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, ssh, sftp, discard=False):
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed or not self._is_healthy(ssh, sftp, False):
+                self._close(ssh, sftp)
+            else:
+                self._idle.append((ssh, sftp, time.time()))
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """
+        Borrow an SFTPClient for the duration of a with block. The session is
+        discarded instead of returned when the block fails on an SSH/IO error.
+        """
+        ssh, sftp = self.acquire()
+        discard = False
+        try:
+            yield sftp
+        except (paramiko.SSHException, EOFError, OSError):
+            discard = True
+            raise
+        finally:
+            self.release(ssh, sftp, discard)
+
+    def evict_idle(self):
+        now = time.time()
+        with self._cond:
+            keep = []
+            for ssh, sftp, last_used in self._idle:
+                if now - last_used > self.idle_timeout:
+                    self._close(ssh, sftp)
+                else:
+                    keep.append((ssh, sftp, last_used))
+            self._idle = keep
+
+    def stats(self):
+        with self._cond:
+            return {"idle": len(self._idle), "in_use": self._in_use, "max_size": self.max_size}
+
+    def close_all(self):
+        with self._cond:
+            self._closed = True
+            for ssh, sftp, last_used in self._idle:
+                self._close(ssh, sftp)
+            self._idle = []
+            self._cond.notify_all()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Source Catalog"
+__purpose__= "Local copy of the geoentity-sources catalog, refreshed in the background and kept on disk across restarts."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import json
+import os
+import uuid
+
+import requests
+
+from ttl_cache import TTLCache
+
+
+SOURCE_API_URL = os.getenv("GEOENTITY_SOURCES_URL", "https://vedas.sac.gov.in/geoentity-services/api/geoentity-sources/")
+CATALOG_TTL = int(os.getenv("GEOENTITY_SOURCES_TTL", "300"))
+CATALOG_CACHE_FILE = os.getenv("GEOENTITY_SOURCES_CACHE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geoentity_sources.json"))
+
+
+class SourceCatalog:
+    """
+    The geoentity-sources API response ({"data": [...]}) held in a TTLCache.
+
+    Only the very first start without a saved copy waits on the remote API,
+    afterwards pages are served from memory (or the copy saved on disk) while
+    a background thread revalidates it past ttl.
+    """
+
+    def __init__(self, url=SOURCE_API_URL, ttl=CATALOG_TTL, cache_file=CATALOG_CACHE_FILE, timeout=30):
+        self.url = url
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.cache = TTLCache(self._fetch, ttl, name="Geoentity source catalog")
+        saved = self._read_saved()
+        if saved is not None:
+            self.cache.seed(saved)
+
+    def _read_saved(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "r") as saved_file:
+                return json.load(saved_file)
+        except (OSError, ValueError) as e:
+            print("[Warning]: Ignoring saved source catalog " + self.cache_file + ": " + str(e) + "\r\n")
+            return None
+
+    def _save(self, payload):
+        tmp_path = self.cache_file + ".tmp-" + uuid.uuid4().hex
+        try:
+            with open(tmp_path, "w") as saved_file:
+                json.dump(payload, saved_file)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print("[Warning]: Could not save source catalog to " + self.cache_file + ": " + str(e) + "\r\n")
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        payload = response.json()
+        if not isinstance(payload.get("data"), list):
+            raise ValueError("Unexpected geoentity-sources response, no data list")
+        if self.cache_file:
+            self._save(payload)
+        return payload
+
+    def entry(self):
+        # TTLCache entry, for cached_json_response
+        return self.cache.get()
+
+    def sources(self):
+        return self.cache.get()["data"]["data"]
+
+    def invalidate(self):
+        self.cache.invalidate()
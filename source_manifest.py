@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Source Manifest"
+__purpose__= "File and per-feature hashes of an ingested geojson, to skip unchanged republishes or ingest only the diff."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import hashlib
+import json
+
+
+class HashingReader:
+    """
+    File object wrapper computing the SHA-256 of everything read through it.
+    """
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.file_obj.read(size)
+        self.sha256.update(data if isinstance(data, bytes) else data.encode("utf-8"))
+        self.size = self.size + len(data)
+        return data
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def config_hash(entity_config):
+    # A manifest is only reusable with the same source and file config (prefix, attributes, parent)
+    relevant = {"geoentity_source": entity_config["geoentity_source"], "geoJSON_file_config": entity_config["geoentity_config"]["geoJSON_file_config"]}
+    relevant = json.loads(json.dumps(relevant))
+    relevant["geoentity_source"].pop("reprocess_flag", None)
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def feature_key(feature, feature_id_attribute):
+    return str((feature.get("properties") or {}).get(feature_id_attribute))
+
+
+def feature_hash(feature):
+    content = {"geometry": feature.get("geometry"), "properties": feature.get("properties")}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ManifestBuilder:
+    """
+    Records the hash of every feature streamed through accept(). With previous_hashes,
+    accept() returns False for the features whose hash did not change (diff ingestion)
+    and the diff is computed during the same pass: previous_hashes is consumed as
+    features are seen, so the two hash dicts together stay about one manifest large,
+    and what is left of it at the end are the removed features.
+    Changed features past the first skip accepted ones (resumed load) are queued for
+    take_changed(), their rows have to be deleted before the new version is loaded.
+    """
+
+    def __init__(self, feature_id_attribute, previous_hashes=None, skip=0):
+        self.feature_id_attribute = feature_id_attribute
+        self.previous_hashes = previous_hashes
+        self.skip = skip
+        self.hashes = {}
+        self.accepted = 0
+        self.stats = {"features_added": 0, "features_changed": 0, "features_unchanged": 0}
+        self._changed = []
+
+    def accept(self, feature):
+        key = feature_key(feature, self.feature_id_attribute)
+        digest = feature_hash(feature)
+        self.hashes[key] = digest
+        if self.previous_hashes is None:
+            return True
+        previous = self.previous_hashes.pop(key, None)
+        if previous == digest:
+            self.stats["features_unchanged"] += 1
+            return False
+        if previous is None:
+            self.stats["features_added"] += 1
+        else:
+            self.stats["features_changed"] += 1
+            if self.accepted >= self.skip:
+                self._changed.append(key)
+        self.accepted = self.accepted + 1
+        return True
+
+    def take_changed(self):
+        keys = self._changed
+        self._changed = []
+        return keys
+
+    def removed(self):
+        # only meaningful once the whole file went through accept()
+        return set(self.previous_hashes or ())
+
+
+def to_geoentity_ids(keys, geojson_file_config):
+    # Same id building as the bulk loader: prefix_identifier + feature_ID (integer ids without decimals)
+    feature_id_type = geojson_file_config["geoJSON_info_attribute"].get("feature_ID_type", "str")
+    geoentity_ids = []
+    for key in keys:
+        if feature_id_type == "Int":
+            try:
+                key = str(int(float(key)))
+            except ValueError:
+                pass
+        geoentity_ids.append(geojson_file_config["prefix_identifier"] + key)
+    return geoentity_ids
+
+
+def delete_features(cur, geoentity_table, geoentity_source_id, geoentity_ids):
+    """
+    Deletes the rows of the given (unprefixed) geoentity_id. Rows which got their parent id
+    prefixed by the spatial join are matched on the part following parent_id.
+    """
+    if not geoentity_ids:
+        return 0
+    cur.execute("DELETE FROM " + geoentity_table + " WHERE geoentity_source_id = %s"
+                + " AND (CASE WHEN parent_id IS NOT NULL AND left(geoentity_id, length(parent_id)) = parent_id THEN substr(geoentity_id, length(parent_id) + 1) ELSE geoentity_id END) = ANY(%s)",
+                (geoentity_source_id, list(geoentity_ids)))
+    return cur.rowcount
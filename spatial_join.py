@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Spatial Join"
+__purpose__= "Phase-3 parent assignment as parallel, resumable batches over pooled connections."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+import psycopg2.errors
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_PARENTS_PER_BATCH = 50
+DEADLOCK_RETRIES = 3
+
+
+def _points_table(geoentity_source_id):
+    return "geoentity_join_points_" + str(int(geoentity_source_id))
+
+
+def prepare_points(cur, geoentity_table, geoentity_source_id, point_function="ST_PointOnSurface"):
+    """
+    Purpose
+    ----------
+    Precomputes one interior point per not yet assigned child into an unlogged, GiST indexed table
+    (shared by all the join connections, temp tables are per session).
+
+    Returns
+    -------
+    Name of the points table and number of children still without parent.
+    """
+    points_table = _points_table(geoentity_source_id)
+    cur.execute("DROP TABLE IF EXISTS " + points_table)
+    cur.execute("CREATE UNLOGGED TABLE " + points_table + " AS SELECT geoentity_id, " + point_function + "(geom) AS pt FROM " + geoentity_table
+                + " WHERE geoentity_source_id = %s AND parent_id IS NULL AND geom IS NOT NULL AND NOT ST_IsEmpty(geom)", (geoentity_source_id,))
+    pending = cur.rowcount
+    cur.execute("CREATE INDEX ON " + points_table + " USING GIST (pt)")
+    cur.execute("CREATE INDEX ON " + points_table + " (geoentity_id)")
+    cur.execute("ANALYZE " + points_table)
+    return points_table, pending
+
+
+def reset_parent_join(cur, geoentity_table, geoentity_source_id):
+    """
+    Purpose
+    ----------
+    Undoes the parent assignment of a source before it is reprocessed: geoentity_id gets back the
+    part following parent_id (the id of the file) and parent_id/parent_name are cleared, so the
+    reprocessed features meet their existing rows on (geoentity_source_id, geoentity_id) and
+    Phase-3 assigns the parents again.
+
+    Returns
+    -------
+    Number of rows reset.
+    """
+    cur.execute("UPDATE " + geoentity_table + " SET geoentity_id = substr(geoentity_id, length(parent_id) + 1), parent_id = NULL, parent_name = NULL"
+                + " WHERE geoentity_source_id = %s AND parent_id IS NOT NULL AND left(geoentity_id, length(parent_id)) = parent_id", (geoentity_source_id,))
+    return cur.rowcount
+
+
+def _parent_batches(cur, geoentity_table, parent_source_id, parents_per_batch):
+    cur.execute("SELECT geoentity_id FROM " + geoentity_table + " WHERE geoentity_source_id = %s ORDER BY geoentity_id", (parent_source_id,))
+    parent_ids = [row[0] for row in cur.fetchall()]
+    return [parent_ids[i:i + parents_per_batch] for i in range(0, len(parent_ids), parents_per_batch)]
+
+
+def _join_batch(db_pool, geoentity_table, points_table, geoentity_source_id, parent_source_id, parent_ids):
+    # parent_id IS NULL makes a batch idempotent: rerunning it never concatenates an id twice,
+    # a child whose prefixed id is already taken is left unmatched instead of failing the batch
+    query = ("UPDATE " + geoentity_table + " AS child SET geoentity_id = CONCAT(parent.geoentity_id, child.geoentity_id), parent_id = parent.geoentity_id, parent_name = parent.name, parent_geoentity_source_id = parent.geoentity_source_id"
+             + " FROM " + geoentity_table + " AS parent, " + points_table + " AS pts"
+             + " WHERE parent.geoentity_source_id = %s AND parent.geoentity_id = ANY(%s)"
+             + " AND ST_Intersects(parent.geom, pts.pt) AND ST_Contains(parent.geom, pts.pt)"
+             + " AND child.geoentity_source_id = %s AND child.geoentity_id = pts.geoentity_id AND child.parent_id IS NULL"
+             + " AND NOT EXISTS (SELECT 1 FROM " + geoentity_table + " AS taken WHERE taken.geoentity_source_id = child.geoentity_source_id AND taken.geoentity_id = CONCAT(parent.geoentity_id, child.geoentity_id))")
+    for attempt in range(DEADLOCK_RETRIES):
+        start = time.time()
+        try:
+            with db_pool.connection(statement_timeout=0) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (parent_source_id, parent_ids, geoentity_source_id))
+                    updated = cur.rowcount
+            return updated, time.time() - start
+        except psycopg2.errors.DeadlockDetected:
+            if attempt == DEADLOCK_RETRIES - 1:
+                raise
+            time.sleep(1 + attempt)
+
+
+def parallel_parent_join(db_pool, geoentity_table, geoentity_source_id, parent_source_id, workers=DEFAULT_WORKERS, parents_per_batch=DEFAULT_PARENTS_PER_BATCH, point_function="ST_PointOnSurface", progress=None):
+    """
+    Purpose
+    ----------
+    Assigns parent_id, parent_name, parent_geoentity_source_id and the concatenated geoentity_id
+    of the children of geoentity_source_id, parents partitioned into batches joined in parallel.
+
+    Parameters
+    ----------
+    db_pool : db_pool.PooledDB with at least workers connections
+    geoentity_table : geoentity table
+    geoentity_source_id : child source
+    parent_source_id : parent source
+    workers : batches running concurrently
+    parents_per_batch : parent geoentities per UPDATE
+    point_function : ST_PointOnSurface (always inside the child) or ST_Centroid (previous behaviour)
+    progress : optional callable(summary) after every batch
+
+    Returns
+    -------
+    Summary dict: batches, updated, unmatched, seconds, batch_timings.
+    Only children without parent are processed, an interrupted join resumes where it stopped.
+    """
+    start = time.time()
+    with db_pool.connection(autocommit=True, statement_timeout=0) as conn:
+        with conn.cursor() as cur:
+            points_table, pending = prepare_points(cur, geoentity_table, geoentity_source_id, point_function)
+            batches = _parent_batches(cur, geoentity_table, parent_source_id, parents_per_batch)
+    print("[Info]:  Phase3 " + str(pending) + " children to assign over " + str(len(batches)) + " parent batches with " + str(workers) + " workers.\r\n")
+
+    summary = {"batches": len(batches), "done": 0, "updated": 0, "unmatched": None, "seconds": 0.0, "batch_timings": []}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_join_batch, db_pool, geoentity_table, points_table, geoentity_source_id, parent_source_id, parent_ids): index for index, parent_ids in enumerate(batches)}
+            for future in as_completed(futures):
+                updated, seconds = future.result()
+                summary["done"] += 1
+                summary["updated"] += updated
+                summary["batch_timings"].append({"batch": futures[future], "updated": updated, "seconds": round(seconds, 3)})
+                print("[Info]:  Phase3 batch " + str(futures[future]) + " assigned " + str(updated) + " children in " + str(round(seconds, 2)) + " s (" + str(summary["done"]) + "/" + str(len(batches)) + ")\r\n")
+                if progress:
+                    progress(summary)
+    finally:
+        with db_pool.connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS " + points_table)
+                cur.execute("SELECT COUNT(*) FROM " + geoentity_table + " WHERE geoentity_source_id = %s AND parent_id IS NULL", (geoentity_source_id,))
+                summary["unmatched"] = cur.fetchone()[0]
+
+    summary["seconds"] = round(time.time() - start, 3)
+    print("[Info]:  Phase3 assigned " + str(summary["updated"]) + " children, unmatched " + str(summary["unmatched"]) + ", in " + str(summary["seconds"]) + " s\r\n")
+    return summary
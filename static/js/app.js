@@ -51,7 +51,7 @@ new Vue({
         fetchData() {
             this.loading = true;
             this.error = null;
-            fetch('https://vedas.sac.gov.in/geoentity-services/api/geoentity-sources/')
+            fetch('/api/geoentity-sources/')
                 .then(res => res.json())
                 .then(data => {
                     this.rawData = data.data;
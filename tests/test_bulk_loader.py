@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Bulk Loader Tests"
+__purpose__= "Vectorized Phase-2 row preparation (prepare_frame) against the row by row path (prepare_row), no database needed."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+gpd = pytest.importorskip("geopandas")
+pytest.importorskip("psycopg2")
+shapely_geometry = pytest.importorskip("shapely.geometry")
+
+import geoentity_bulk_loader
+
+
+def file_config(feature_id_type="str", aux_attributes=("district", "Level_IV_code")):
+    config = {
+        "prefix_identifier": "IN",
+        "geoJSON_info_attribute": {"name": "name", "feature_ID": "fid", "feature_ID_type": feature_id_type}
+    }
+    if aux_attributes is not None:
+        config["geoJSON_aux_attributes"] = list(aux_attributes)
+    return config
+
+
+def sample_frame():
+    point = shapely_geometry.Point
+    return gpd.GeoDataFrame({
+        "name": ["Anand", float("nan"), "", "O'Brien", None, "Surat"],
+        # read from GeoJSON, integer ids with a missing value come back as floats
+        "fid": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        "district": ["A", None, "C", float("nan"), "E", "F"],
+        "Level_IV_code": [10, 20, 30, 40, 50, 60]
+    }, geometry=[point(72.9, 22.5), point(0, 0), point(1, 1), None, point(2, 2), shapely_geometry.Polygon()], crs="EPSG:4326")
+
+
+def prepared(gdf, config, vectorized, batch_size=4):
+    batches = list(geoentity_bulk_loader.prepare_batches(gdf, config, batch_size, vectorized=vectorized))
+    return [record for records, _ in batches for record in records], sum(skipped for _, skipped in batches)
+
+
+@pytest.mark.parametrize("feature_id_type", ["str", "Int"])
+@pytest.mark.parametrize("aux_attributes", [("district", "Level_IV_code"), (), None])
+@pytest.mark.parametrize("batch_size", [1, 4, 100])
+def test_vectorized_matches_row_path(feature_id_type, aux_attributes, batch_size):
+    config = file_config(feature_id_type, aux_attributes)
+    vectorized = prepared(sample_frame(), config, True, batch_size)
+    row_by_row = prepared(sample_frame(), config, False, batch_size)
+    assert vectorized == row_by_row
+    assert vectorized[1] == 3
+
+
+def test_records_content():
+    records, skipped = prepared(sample_frame(), file_config("Int"), True)
+    assert skipped == 3
+    assert [record[0] for record in records] == ["IN1", "IN4", "IN6"]
+    assert records[1][1] == "OBrien"
+    # missing and empty geometries are loaded as NULL
+    assert records[1][2] is None and records[2][2] is None
+    assert records[0][2] is not None
+    assert records[0][3] == '{"features": {"district": "A", "Level_lV": "10"}}'
+
+
+def test_non_str_name_fails_as_row_path():
+    gdf = sample_frame()
+    gdf["name"] = gdf["name"].astype(object)
+    gdf.loc[0, "name"] = 12
+    for vectorized in (True, False):
+        with pytest.raises(AttributeError):
+            prepared(gdf, file_config(), vectorized)
+
+
+def test_missing_str_feature_id_matches_row_path():
+    gdf = sample_frame()
+    gdf.loc[0, "fid"] = float("nan")
+    assert prepared(gdf, file_config(), True) == prepared(gdf, file_config(), False)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "Spatial Join Tests"
+__purpose__= "Republish of a spatially joined child layer against a PostGIS database (GEOENTITY_TEST_DSN)."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+psycopg2 = pytest.importorskip("psycopg2")
+pytest.importorskip("shapely")
+pytest.importorskip("pandas")
+
+import db_pool
+import geoentity_bulk_loader
+import spatial_join
+
+
+TEST_DSN = os.getenv("GEOENTITY_TEST_DSN")
+TABLE = "geoentity_join_test_" + str(os.getpid())
+PARENT_SOURCE_ID = 1
+CHILD_SOURCE_ID = 2
+
+pytestmark = pytest.mark.skipif(not TEST_DSN, reason="GEOENTITY_TEST_DSN is not set")
+
+
+@pytest.fixture
+def database():
+    conn = psycopg2.connect(TEST_DSN)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE " + TABLE + " (geoentity_source_id integer NOT NULL, geoentity_id varchar NOT NULL, name varchar, geom geometry(Geometry, 4326),"
+                + " auxdata json, parent_id varchar, parent_name varchar, parent_geoentity_source_id integer, PRIMARY KEY (geoentity_source_id, geoentity_id))")
+    cur.execute("INSERT INTO " + TABLE + " (geoentity_source_id, geoentity_id, name, geom) VALUES"
+                + " (%s, 'P1', 'Parent 1', ST_MakeEnvelope(0, 0, 10, 10, 4326)), (%s, 'P2', 'Parent 2', ST_MakeEnvelope(10, 0, 20, 10, 4326))",
+                (PARENT_SOURCE_ID, PARENT_SOURCE_ID))
+    params = psycopg2.extensions.parse_dsn(TEST_DSN)
+    pool = db_pool.PooledDB(params.get("dbname"), params.get("user"), params.get("password"), params.get("host", "localhost"), params.get("port", 5432), maxconn=3)
+    try:
+        yield cur, pool
+    finally:
+        pool.closeall()
+        cur.execute("DROP TABLE IF EXISTS " + TABLE)
+        conn.close()
+
+
+def child_records(cur):
+    cur.execute("SELECT encode(ST_AsEWKB(ST_MakeEnvelope(1, 1, 2, 2, 4326)), 'hex'), encode(ST_AsEWKB(ST_MakeEnvelope(11, 1, 12, 2, 4326)), 'hex')")
+    first, second = cur.fetchone()
+    return [("C1", "Child 1", first, None), ("C2", "Child 2", second, None)]
+
+
+def load_children(cur, reprocess_flag, reprocess_mode="skip"):
+    geoentity_bulk_loader.create_staging_table(cur, TABLE)
+    return geoentity_bulk_loader.load_batch(cur, child_records(cur), TABLE, CHILD_SOURCE_ID, PARENT_SOURCE_ID, False, reprocess_flag, reprocess_mode)
+
+
+def child_ids(cur):
+    cur.execute("SELECT geoentity_id FROM " + TABLE + " WHERE geoentity_source_id = %s ORDER BY geoentity_id", (CHILD_SOURCE_ID,))
+    return [row[0] for row in cur.fetchall()]
+
+
+@pytest.mark.parametrize("reprocess_mode", geoentity_bulk_loader.REPROCESS_MODES)
+def test_republish_joined_layer(database, reprocess_mode):
+    cur, pool = database
+    load_children(cur, False)
+    spatial_join.parallel_parent_join(pool, TABLE, CHILD_SOURCE_ID, PARENT_SOURCE_ID, workers=2)
+    assert child_ids(cur) == ["P1C1", "P2C2"]
+
+    # republish: the same features again, as Phase-2 and Phase-3 of a reprocessed ingestion
+    assert spatial_join.reset_parent_join(cur, TABLE, CHILD_SOURCE_ID) == 2
+    counts = load_children(cur, True, reprocess_mode)
+    assert counts["inserted"] == 0
+    assert counts["unchanged"] == 2
+    summary = spatial_join.parallel_parent_join(pool, TABLE, CHILD_SOURCE_ID, PARENT_SOURCE_ID, workers=2)
+    assert summary["updated"] == 2
+    assert summary["unmatched"] == 0
+    assert child_ids(cur) == ["P1C1", "P2C2"]
+
+
+def test_join_skips_taken_prefixed_id(database):
+    cur, pool = database
+    load_children(cur, False)
+    spatial_join.parallel_parent_join(pool, TABLE, CHILD_SOURCE_ID, PARENT_SOURCE_ID, workers=2)
+    # unprefixed duplicates left by a republish without reset must not fail the join
+    load_children(cur, True)
+    summary = spatial_join.parallel_parent_join(pool, TABLE, CHILD_SOURCE_ID, PARENT_SOURCE_ID, workers=2)
+    assert summary["unmatched"] == 2
+    assert child_ids(cur) == ["C1", "C2", "P1C1", "P2C2"]
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Tile Server"
+__purpose__= "Mapbox vector tiles rendered from the pyramid levels, with an in-memory LRU tile cache."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pyramid_engine
+
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MAX_ZOOM = 22
+LAYER_NAME = "geoentity"
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_query():
+    # The 4326 envelope (slightly expanded for the tile buffer) drives the GiST index, geometries are clipped in 3857
+    return ("WITH bounds AS (SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom_3857,"
+            + " ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => " + str(MVT_BUFFER / MVT_EXTENT) + "), 4326) AS geom_4326)"
+            + " SELECT ST_AsMVT(tile, '" + LAYER_NAME + "', " + str(MVT_EXTENT) + ", 'geom') FROM ("
+            + " SELECT p.geoentity_id, g.name, ST_AsMVTGeom(ST_Transform(p.geom, 3857), bounds.geom_3857, " + str(MVT_EXTENT) + ", " + str(MVT_BUFFER) + ", true) AS geom"
+            + " FROM " + pyramid_engine.PYRAMID_TABLE + " p CROSS JOIN bounds"
+            + " LEFT JOIN geoentity g ON g.geoentity_source_id = p.geoentity_source_id AND g.geoentity_id = p.geoentity_id"
+            + " WHERE p.geoentity_source_id = %(source_id)s AND p.level = %(level)s AND p.geom && bounds.geom_4326"
+            + ") AS tile WHERE tile.geom IS NOT NULL")
+
+
+def render_tile(cur, geoentity_source_id, z, x, y, level=None):
+    """
+    Purpose
+    ----------
+    Renders one tile from the pyramid level matching the zoom (pyramid_engine.level_for_zoom).
+
+    Returns
+    -------
+    Gzip compressed MVT bytes, b"" for an empty tile.
+    """
+    if level is None:
+        level = pyramid_engine.level_for_zoom(z)
+    cur.execute(tile_query(), {"z": z, "x": x, "y": y, "source_id": int(geoentity_source_id), "level": level})
+    row = cur.fetchone()
+    data = bytes(row[0]) if row and row[0] is not None else b""
+    return gzip.compress(data, 6) if data else b""
+
+
+def tile_entry(data):
+    # (gzip bytes, etag) as held by the caches
+    return data, hashlib.sha1(data).hexdigest()
+
+
+class TileCache:
+    """
+    LRU of rendered tiles {key: (gzip bytes, etag)} bounded by the total tile size.
+    Keys start with the geoentity_source_id so a source can be invalidated after a rebuild.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self._metrics["misses"] += 1
+                return None
+            self._tiles.move_to_end(key)
+            self._metrics["hits"] += 1
+            return tile
+
+    def put(self, key, data, etag=None):
+        tile = tile_entry(data) if etag is None else (data, etag)
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._tiles[key] = tile
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._bytes -= len(evicted[0])
+                self._metrics["evictions"] += 1
+        return tile
+
+    def invalidate(self, geoentity_source_id):
+        source_id = int(geoentity_source_id)
+        with self._lock:
+            for key in [key for key in self._tiles if key[0] == source_id]:
+                self._bytes -= len(self._tiles.pop(key)[0])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["tiles"] = len(self._tiles)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+def get_tile(db_pool, tile_cache, geoentity_source_id, z, x, y, tile_store=None):
+    """
+    Returns (gzip bytes, etag) of a tile: from memory, else from the on-disk tile_store when given,
+    else rendered on a pooled connection and kept in both.
+    """
+    level = pyramid_engine.level_for_zoom(z)
+    key = (int(geoentity_source_id), level, z, x, y)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        return tile
+    if tile_store is not None:
+        tile = tile_store.get(key)
+        if tile is not None:
+            return tile_cache.put(key, tile[0], tile[1])
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            data = render_tile(cur, geoentity_source_id, z, x, y, level)
+    tile = tile_cache.put(key, data)
+    if tile_store is not None:
+        tile_store.put(key, tile[0], tile[1])
+    return tile
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "GeoEntity Tile Store"
+__purpose__= "MBTiles-style SQLite cache of rendered vector tiles, seeded after pyramid builds and invalidated per source."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import math
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyramid_engine
+import tile_server
+
+
+TILE_DB_PATH = os.getenv("TILE_DB_PATH", "tile_cache.mbtiles")
+DEFAULT_SEED_MAX_ZOOM = 6
+DEFAULT_SEED_WORKERS = 4
+MAX_LATITUDE = 85.0511287798
+
+
+class TileStore:
+    """
+    Rendered tiles on disk, one row per (geoentity_source_id, level, z, x, y).
+
+    Rows follow the MBTiles tiles table (zoom_level, tile_column and a TMS
+    flipped tile_row) with the source and pyramid level added to the key,
+    tile_data is the gzip compressed MVT as served.
+    """
+
+    def __init__(self, path=TILE_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tiles (
+                    geoentity_source_id INTEGER NOT NULL,
+                    level INTEGER NOT NULL,
+                    zoom_level INTEGER NOT NULL,
+                    tile_column INTEGER NOT NULL,
+                    tile_row INTEGER NOT NULL,
+                    tile_data BLOB NOT NULL,
+                    etag TEXT NOT NULL,
+                    created_on REAL,
+                    PRIMARY KEY (geoentity_source_id, level, zoom_level, tile_column, tile_row)
+                )
+            ''')
+            conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', 'pbf')")
+
+    def _connect(self):
+        # Flask threads and seeding workers share the file, wait on locks instead of failing
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _row_key(key):
+        source_id, level, z, x, y = key
+        return (source_id, level, z, x, (2 ** z) - 1 - y)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT tile_data, etag FROM tiles WHERE geoentity_source_id = ? AND level = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                               self._row_key(key)).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    def put(self, key, data, etag):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO tiles (geoentity_source_id, level, zoom_level, tile_column, tile_row, tile_data, etag, created_on) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         self._row_key(key) + (sqlite3.Binary(data), etag, time.time()))
+
+    def invalidate(self, geoentity_source_id):
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM tiles WHERE geoentity_source_id = ?", (int(geoentity_source_id),)).rowcount
+        return deleted
+
+    def stats(self):
+        with self._connect() as conn:
+            tiles, size = conn.execute("SELECT count(*), coalesce(sum(length(tile_data)), 0) FROM tiles").fetchone()
+        return {"path": self.path, "tiles": tiles, "bytes": size}
+
+
+#------------------------------------#
+# Seeding                            #
+#------------------------------------#
+def tile_range(bounds, z):
+    """
+    Tiles (x_min, y_min, x_max, y_max) covering a lon/lat bounds (xmin, ymin, xmax, ymax) at zoom z.
+    """
+    def tile_xy(lon, lat):
+        lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+        n = 2 ** z
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x_min, y_min = tile_xy(bounds[0], bounds[3])
+    x_max, y_max = tile_xy(bounds[2], bounds[1])
+    return x_min, y_min, x_max, y_max
+
+
+def source_bounds(cur, geoentity_source_id):
+    # Extent of the coarsest level, the fewest rows to scan
+    cur.execute("SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (SELECT ST_Extent(geom) AS e FROM " + pyramid_engine.PYRAMID_TABLE
+                + " WHERE geoentity_source_id = %s AND level = %s) AS extent", (int(geoentity_source_id), len(pyramid_engine.TOLERANCES) - 1))
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return row
+
+
+def _seed_tile(db_pool, tile_store, geoentity_source_id, z, x, y):
+    level = pyramid_engine.level_for_zoom(z)
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            data = tile_server.render_tile(cur, geoentity_source_id, z, x, y, level)
+    data, etag = tile_server.tile_entry(data)
+    tile_store.put((int(geoentity_source_id), level, z, x, y), data, etag)
+    return len(data)
+
+
+def seed_tiles(db_pool, tile_store, geoentity_source_id, max_zoom=DEFAULT_SEED_MAX_ZOOM, workers=DEFAULT_SEED_WORKERS):
+    """
+    Purpose
+    ----------
+    Pre-renders the tiles of zoom 0 to max_zoom over the source extent into the tile store,
+    so first map loads of the low zooms are read from disk.
+
+    Parameters
+    ----------
+    db_pool : db_pool.PooledDB
+    tile_store : TileStore
+    geoentity_source_id : source to seed
+    max_zoom : last zoom seeded
+    workers : tiles rendered concurrently, capped to the pool size minus one connection left for requests
+
+    Returns
+    -------
+    Generator of progress messages.
+    """
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            bounds = source_bounds(cur, geoentity_source_id)
+    if bounds is None:
+        yield f"No pyramid levels for {geoentity_source_id}, nothing to seed"
+        return
+
+    workers = max(1, min(int(workers), db_pool.maxconn - 1))
+    start = time.time()
+    total_tiles = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-seed") as executor:
+        for z in range(int(max_zoom) + 1):
+            x_min, y_min, x_max, y_max = tile_range(bounds, z)
+            tiles = [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+            sizes = list(executor.map(lambda xy: _seed_tile(db_pool, tile_store, geoentity_source_id, z, xy[0], xy[1]), tiles))
+            total_tiles = total_tiles + len(tiles)
+            yield f"Seeded zoom {z}: {len(tiles)} tiles, {sum(sizes)} bytes"
+    yield f"Seeded {total_tiles} tiles of {geoentity_source_id} in {round(time.time() - start, 2)} s"
+
+
+if __name__ == "__main__":
+    # python tile_store.py <geoentity_source_id> [max_zoom]
+    import db_pool as pg_pool
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    source_id = int(sys.argv[1])
+    seed_max_zoom = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SEED_MAX_ZOOM
+    pool = pg_pool.pool_from_env(maxconn=DEFAULT_SEED_WORKERS + 1)
+    store = TileStore()
+    print("[Info]:  Removed " + str(store.invalidate(source_id)) + " cached tiles of " + str(source_id) + "\r\n")
+    for message in seed_tiles(pool, store, source_id, seed_max_zoom):
+        print("[Info]:  " + message + "\r\n")
+    pool.closeall()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "TTL Cache"
+__purpose__= "In-memory JSON payload cache refreshed in the background once stale, served with ETag validation."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from flask import request, Response
+
+
+class TTLCache:
+    """
+    Holds the result of loader() serialized once as JSON with its ETag.
+
+    get() loads synchronously only when nothing is cached yet. Past ttl the
+    cached payload keeps being served while a single background thread
+    reloads it, a failed reload keeps the previous payload and is retried
+    at the next get().
+    """
+
+    def __init__(self, loader, ttl=30, name="cache"):
+        self.loader = loader
+        self.ttl = ttl
+        self.name = name
+        self._entry = None  # {"data", "body", "etag", "loaded_on"}
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def _entry_for(data, loaded_on):
+        body = json.dumps(data, default=str).encode("utf-8")
+        return {"data": data, "body": body, "etag": hashlib.sha1(body).hexdigest(), "loaded_on": loaded_on}
+
+    def _load(self):
+        start = time.time()
+        entry = self._entry_for(self.loader(), time.time())
+        print("[Info]:  " + self.name + " reloaded in " + str(round(entry["loaded_on"] - start, 3)) + " s\r\n")
+        return entry
+
+    def seed(self, data):
+        """
+        Installs an already known payload (e.g. a copy saved to disk) as stale,
+        the first get() answers from it and reloads in the background.
+        """
+        with self._lock:
+            if self._entry is None:
+                self._entry = self._entry_for(data, 0)
+
+    def _refresh(self):
+        try:
+            entry = self._load()
+            with self._lock:
+                self._entry = entry
+        except Exception as e:
+            print("<Error> " + self.name + " refresh failed, serving the previous version: " + str(e) + "\r\n")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        """
+        Returns the cached entry, refreshing it in the background when older than ttl.
+        """
+        with self._lock:
+            entry = self._entry
+            if entry is not None:
+                if time.time() - entry["loaded_on"] >= self.ttl and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, name=self.name + "-refresh", daemon=True).start()
+                return entry
+        entry = self._load()
+        with self._lock:
+            if self._entry is None or self._entry["loaded_on"] < entry["loaded_on"]:
+                self._entry = entry
+        return entry
+
+    def invalidate(self):
+        # the next get() reloads in the background and still answers from the current payload
+        with self._lock:
+            if self._entry is not None:
+                self._entry["loaded_on"] = 0
+
+
+def cached_json_response(entry, max_age=0, compress=True):
+    """
+    Flask response for a TTLCache entry, 304 when the request If-None-Match has its ETag.
+    With compress the body is sent gzip encoded to clients accepting it, compressed once per entry.
+    """
+    use_gzip = compress and "gzip" in request.accept_encodings
+    etag = entry["etag"] + ("-gz" if use_gzip else "")
+    headers = {"ETag": '"' + etag + '"', "Cache-Control": "max-age=" + str(int(max_age))}
+    if compress:
+        headers["Vary"] = "Accept-Encoding"
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if not use_gzip:
+        return Response(entry["body"], mimetype="application/json", headers=headers)
+    if "gzip_body" not in entry:
+        entry["gzip_body"] = gzip.compress(entry["body"], 6)
+    headers["Content-Encoding"] = "gzip"
+    return Response(entry["gzip_body"], mimetype="application/json", headers=headers)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#------------------------------------#
+# Module Description                 #
+#------------------------------------#
+__module__= "SFTP Upload Stream"
+__purpose__= "Streams an uploaded GeoJSON to the remote server in fixed-size chunks while the request is parsed."
+
+#------------------------------------#
+# Module Import                      #
+#------------------------------------#
+import hashlib
+import time
+
+import ijson
+import paramiko
+from flask import Request
+
+
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class SFTPUploadStream:
+    """
+    Writable file object given to the multipart parser in place of a temporary file.
+
+    Data is buffered up to chunk_size and written to remote_path + ".part" with
+    pipelined SFTP writes (no round trip per write), the SHA-256 and the property
+    names of the first feature are computed on the way. commit() renames the part
+    file to remote_path, abort() removes it.
+    """
+
+    def __init__(self, sftp_pool, remote_path, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.sftp_pool = sftp_pool
+        self.remote_path = remote_path
+        self.part_path = remote_path + ".part"
+        self.chunk_size = chunk_size
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.columns = None
+        self._buffer = []
+        self._buffered = 0
+        self._features = ijson.sendable_list()
+        self._parser = ijson.items_coro(self._features, 'features.item', use_float=True)
+        self._started = time.time()
+        self._ssh, self._sftp = sftp_pool.acquire()
+        self._file = self._sftp.open(self.part_path, 'wb')
+        self._file.set_pipelined(True)
+
+    #------------------------------------#
+    # File Interface (multipart parser)  #
+    #------------------------------------#
+    def write(self, data):
+        self.sha256.update(data)
+        self.size = self.size + len(data)
+        if self.columns is None:
+            self._find_columns(data)
+        self._buffer.append(data)
+        self._buffered = self._buffered + len(data)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def seek(self, offset, whence=0):
+        # the parser rewinds the stream once the part is complete, nothing is kept locally to rewind
+        self.flush()
+        return 0
+
+    def read(self, size=-1):
+        return b""
+
+    def readline(self, size=-1):
+        return b""
+
+    def _find_columns(self, data):
+        try:
+            self._parser.send(data)
+        except ijson.JSONError:
+            self.columns = []
+            return
+        if self._features:
+            self.columns = list((self._features[0].get("properties") or {}).keys())
+            self._features.clear()
+
+    #------------------------------------#
+    # Completion                         #
+    #------------------------------------#
+    def commit(self):
+        """
+        Completes the upload, returns the upload report.
+        """
+        try:
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._sftp.posix_rename(self.part_path, self.remote_path)
+        except (paramiko.SSHException, EOFError, OSError):
+            self._file = None
+            self.sftp_pool.release(self._ssh, self._sftp, True)
+            raise
+        self.sftp_pool.release(self._ssh, self._sftp)
+        seconds = max(time.time() - self._started, 1e-6)
+        return {
+            "remote_path": self.remote_path,
+            "bytes": self.size,
+            "sha256": self.sha256.hexdigest(),
+            "columns": self.columns or [],
+            "seconds": round(seconds, 3),
+            "mb_per_second": round(self.size / seconds / (1024 * 1024), 2)
+        }
+
+    def abort(self):
+        if self._file is None:
+            return
+        sftp = self._sftp
+        self._buffer = []
+        try:
+            self._file.close()
+            sftp.remove(self.part_path)
+        except (paramiko.SSHException, EOFError, OSError):
+            pass
+        finally:
+            self._file = None
+            self.sftp_pool.release(self._ssh, sftp)
+
+    def close(self):
+        # werkzeug closes uploaded files at request teardown, an upload that was never committed is dropped
+        self.abort()
+
+
+class UploadRequest(Request):
+    """
+    Request class whose file uploads go to upload_stream_factory(filename) when a view set one,
+    otherwise to the usual temporary file.
+    """
+    upload_stream_factory = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_stream_factory is not None and filename:
+            stream = self.upload_stream_factory(filename)
+            if stream is not None:
+                return stream
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)